@@ -3,47 +3,39 @@
 # From 2022 the URL to a verdict changed from www.giustizia-amministrativa.it to portali.giustizia-amministrativa.it
 
 ### IMPORT ### 
-import mechanicalsoup
-from bs4 import BeautifulSoup as bs
+# mechanicalsoup, bs4 and requests are imported inside the functions that use them,
+# so that argument errors exit without loading the heavy dependencies
+from __future__ import annotations
 from datetime import datetime
-import re
 import sys
 from pathlib import Path
-import requests
 from os import replace as os_replace
 from os.path import join as os_join
+import threading
+from typing import TYPE_CHECKING
 
-# print(sys.getrecursionlimit())
+if TYPE_CHECKING:
+    import mechanicalsoup
 
 ### LOCAL IMPORT ###
-from verdict import Verdict 
-from config.config_reader import read_config_yaml
+from config.config_reader import get_settings, pop_cli_overrides
+from scraper_manager.crawler import VerdictStream, get_page_cache, get_session_store
+from scraper_manager.partitions import court_partitions, date_partitions, merge_partition_files, partition_file_name, read_courts
+from scraper_manager.verification import record_page_keys, reset_crawl, verify_crawl
+from utility_manager.manifest import manifest_key, record_manifest_page, update_manifest_entry
+from utility_manager.profiler import finish_profiling, pop_profile_options, span, start_profiling
 from utility_manager.utilities import check_and_create_directory, script_info
 
 ### GLOBALS ###
-yaml_config = read_config_yaml()
-verdict_dir = str(yaml_config["VERDICTS_DIR"])
-verdict_file_name = str(yaml_config["VERDICTS_FILE"])
-paging = int(yaml_config["PAGING"])
-url_search = str(yaml_config["URL_SEARCH"])
-recursion_limit = int(yaml_config["RECURSION_LIMIT"])
-
 script_path, script_name = script_info(__file__)
 
-sys.setrecursionlimit(recursion_limit)
-
 # INPUT
 page_increment = 1 # <-- INPUT to start from a defined page (shift -> move the response of page + page_increment) starting always from 0
 
 # OUTPUT
-# URLs
-total_results = 0  # total numbers of results
-total_pages = 0 # total pages to be parsed
-# verdicts
-verdicts_download_count = 0 # global number of verdicts downloaded
-verdicts_list_obj =[] # global list of verdicts
 # CSV header
 csv_result_header = "pagina;codice_ecli;provvedimento_titolo;provvedimento_tipo;sentenza_numero;tribunale_codice;tribunale_citta;tribunale_sezione;ricorso_numero;sentenza_url;sentenza_file"
+csv_write_lock = threading.Lock() # the pages fetched again by the verification are appended from several threads
 
 ### FUNCTIONS ###
 
@@ -62,10 +54,15 @@ def add_csv_header(verdict_dir:str, file_name:str, header:str) -> None:
 
     temp_file_path = file_path + '.temp'
     
-    # Read the existing content of the file
-    with open(file_path, 'r', newline='') as file:
-        content = file.readlines()
+    # Read the existing content of the file (missing if no page could be written)
+    content = []
+    if Path(file_path).exists():
+        with open(file_path, 'r', newline='') as file:
+            content = file.readlines()
     
+    # Drop the header lines already in the file (e.g. a rerun appends rows after the previous header)
+    content = [line for line in content if line.rstrip('\r\n') != header]
+
     # Write the header and the original data to a new file
     with open(temp_file_path, 'w', newline='') as new_file:
         new_file.write(header + '\n')  # Write the new header
@@ -74,215 +71,328 @@ def add_csv_header(verdict_dir:str, file_name:str, header:str) -> None:
     # Replace the old file with the new one
     os_replace(temp_file_path, file_path)
 
-def get_administrative_judgment(input_search:str, page:int, year_search:int, browser:mechanicalsoup.stateful_browser.StatefulBrowser, paging:int, sentence_file_name:str, total_pages:int, verdicts_download_count:int, page_increment:int) -> None: 
-    """ 
-    Compile and submit the IAJ form: input_search is the querystring, page = 0 is the first page of results 
-    Retrieve administrative judgments based on specified criteria.
+def get_administrative_judgment(input_search:str, year_search:int, settings, sentence_file_name:str, filters:dict=None, browser:mechanicalsoup.stateful_browser.StatefulBrowser=None, pages:list=None, from_cache:bool=False) -> int:
+    """
+    Crawl the result pages of the IAJ form (input_search is the querystring, page 0 is the first page of results)
+    and append the verdicts of each page to the index CSV, one page at a time.
 
     Args:
         input_search (str): The search query or keywords.
-        page (int): The current page number.
         year_search (int): The year of the judgment.
-        browser (mechanicalsoup.stateful_browser.StatefulBrowser): The browser object for web scraping.
-        paging (int): The number of pages to navigate.
-        sentence_file_name (str): The name of the file to save the judgments.
-        total_pages (int): The total number of pages of search results.
-        verdicts_download_count (int): The count of verdicts to download per page.
-        page_increment (int): The increment value for page navigation.
+        settings (config.config_reader.Settings): The validated settings.
+        sentence_file_name (str): The name of the file to save the judgments (with the 'Y' placeholder).
+        filters (dict): Extra form fields of a partition, e.g. {court field: 'cds'} (optional).
+        browser (mechanicalsoup.stateful_browser.StatefulBrowser): The browser object positioned on the search form (optional).
+        pages (list): Only these pages instead of the whole page chain (optional).
+        from_cache (bool): Read page 0 from the page cache too, to re-parse a crawl without requesting it again (optional).
 
     Returns:
-        None: The function does not return anything. It saves the retrieved judgments to a file.
+        int: The number of verdicts written.
     """
+    import mechanicalsoup
+    import requests
+
+    csv_file_path = Path(settings.verdicts_dir) / sentence_file_name.replace("Y", str(year_search))
+    manifest_file = settings.manifest_file_for(year_search)
+    key = manifest_key(input_search, filters)
+
+    def on_summary(res_num:int, total_pages:int) -> None: # first page read: save the number of results
+        print("Results found via URL:", res_num)
+        print("Paging:", settings.paging)
+        print("Page shift:", page_increment)
+        print("Total pages to be parsed:", total_pages)
+        print()
+        update_manifest_entry(settings.verdicts_dir, manifest_file, key, res_num=res_num, total_pages=total_pages, paging=settings.paging, filters=filters or {}, complete=False)
+
+    if pages is None: # a whole crawl reads the results number again and records its own pages, a verification must not trust the ones of a previous run
+        reset_crawl(settings.verdicts_dir, manifest_file, key)
 
-    form_id = "_GaSearch_INSTANCE_2NDgCF3zWBwk_provvedimentiForm"
+    stream = VerdictStream(input_search, year_search, settings, filters, page_increment, pages, browser, on_summary, refresh=pages is not None, from_cache=from_cache) # pages fetched again bypass the cache
+    verdicts_count = 0 # global count (for the whole download)
 
     try:
-        browser.select_form('form[id="'+form_id+'"]') # get the form data by id
-        # print(browser.get_current_form().print_summary()) # get the content objects of the form (debug)
-        
-        browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_searchtextProvvedimenti"] = input_search # textbox
-        browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_pageResultsProvvedimenti"] = paging # selectbox
-        browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_TipoProvvedimentoItem"] = "Sentenza" # selectbox
-        browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_DataYearItem"] = str(year_search) # selectbox
-
-        # _GaSearch_INSTANCE_2NDgCF3zWBwk_DataYearItem
-
-        if (page == 0):  # if it's the first time, save the number of results
-            response = browser.submit_selected()
-            html_content = bs(response.text, 'html.parser')
-            res_num = int(html_content.strong.string) # results number
-            # Pages goes to 0 to n (visualized in the web page as 1 to n+1)
-            # total_pages = int(res_num/paging) + int(res_num%paging) # number of the pages to be parsed (not working)
-            temp_last_page_1 = html_content.find_all('li', {'class':'pagination-li'}) # [-1] contains the last page
-            # print("temp_last_page 1:", temp_last_page_1[-1]) # debug
-            for tag in temp_last_page_1[-1].find_all('a'):
-                try:
-                    if re.match('changePage',tag['onclick']):           # if onclick attribute exist, it will match for changePage, if success will print
-                        # print("Last page object:", x['onclick'])      # debug
-                        onclick = tag['onclick']                        # string value inside onclik
-                        onclick_value = re.findall("[0-9]+",onclick)    # get the numbers inside the Javascript function (is a list)
-                        last_page = int(onclick_value[0])
-                        # print("Last page value:", str(l_page))        # debug
-                        total_pages = last_page
-                except:
-                    print("Error on changePage RegEx")
-                    print()
-            print("Results found via URL:", res_num)
-            print("Paging:", paging)
-            print("Page shift:", page_increment)
-            print("Total pages to be parsed:", total_pages)
+        for page, sentence_list_obj in stream.pages():
+            print(">> Parsing response pages")
+            print(f"Page {page} / {stream.total_pages}")
+            print("Articles (number of sentences) in this page:", len(sentence_list_obj))
             print()
+            for count, verdict in enumerate(sentence_list_obj, start=1):
+                print(f"Result [{count}] / page [{page}]")
+                verdict.toString()
 
-        # if element "_GaSearch_INSTANCE_2NDgCF3zWBwk_step" is not available, LinkNotFoundError happens
-        if (page != 0):
-            browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_step"] = page 
-            response = browser.submit_selected()
-            # print(type(response)) # <class 'requests.models.Response'> (debug)
+            verdicts_count += len(sentence_list_obj)
+            print("Results parsed for this page:", len(sentence_list_obj))
+            print("-> Total sentences parsed until this page:", verdicts_count)
+
+            # write sentences to CSV
+            print("Writing CSV file sentences...")
+            with span("response_parser.write_csv", page=page, rows=len(sentence_list_obj)):
+                page_rows = [f"{page};{a_sentence.toCSV()}" for a_sentence in sentence_list_obj] # stream a verdicts from obj to csv string
+                with csv_write_lock:
+                    with open(csv_file_path, mode="a") as fp:
+                        fp.write("".join(row + "\n" for row in page_rows))
+                    record_page_keys(settings.verdicts_dir, manifest_file, key, page, page_rows) # verdicts written, counted by the verification
+                record_manifest_page(settings.verdicts_dir, manifest_file, key, page, len(sentence_list_obj)) # pages written, for the verification
+            print()
 
-        print(">> Parsing response pages")
-        print(f"Page {page} / {total_pages}")
+        print("Web scraper finished")
+        print("Year:", year_search)
+        print()
 
-        response_parser(input_search, response, page, year_search, browser, paging, sentence_file_name, total_pages, verdicts_download_count, page_increment) # parse the results (response) for the text_to_search
-    
-        return
-    
     except mechanicalsoup.LinkNotFoundError as e:
-        print(f"LinkNotFoundError trying to connect to '{url_search}' (to form elements too)")
+        if pages is not None:
+            raise # recorded by the verification
+        print(f"LinkNotFoundError trying to connect to '{settings.url_search}' (to form elements too)")
+    except requests.RequestException as e: # the pages not written are fetched again by the verification
+        if pages is not None:
+            raise
+        print(f"WARNING! Request to '{settings.url_search}' failed: {e}")
 
+    return verdicts_count
 
-def response_parser(input_search:str, response:requests.models.Response, page:int, year_search:int, browser:mechanicalsoup.stateful_browser.StatefulBrowser, paging:int, sentence_file_name:str, total_pages:int, verdicts_download_count:int, page_increment:int) -> None:
+def verify(input_search:str, year_search:int, settings, sentence_file_name:str, filters:dict=None, recheck:bool=False) -> dict:
     """
-    Parse the response from the web server for administrative judgments.
+    Verify a crawl against the manifest: the rows written page by page are reconciled with the results number,
+    the duplicated rows are removed and only the missing or short pages are fetched again, in parallel.
+    The manifest entry is marked complete (and verified) only if the distinct verdicts written are as many as the results
+    and the results number has been read in this run (if page 0 failed, it is fetched again first).
 
     Args:
         input_search (str): The search query or keywords.
-        response (requests.models.Response): The response object from the web server.
-        page (int): The current page number.
         year_search (int): The year of the judgment.
-        browser (mechanicalsoup.stateful_browser.StatefulBrowser): The browser object for web scraping.
-        paging (int): The number of pages to navigate.
-        sentence_file_name (str): The name of the file to save the judgments.
-        total_pages (int): The total number of pages of search results.
-        verdicts_download_count (int): The count of verdicts to download per page.
-        page_increment (int): The increment value for page navigation.
+        settings (config.config_reader.Settings): The validated settings.
+        sentence_file_name (str): The name of the index file of the crawl (with the 'Y' placeholder).
+        filters (dict): Extra form fields of a partition (optional).
+        recheck (bool): Read the results number again from page 0 (verification of a crawl of a previous run).
 
     Returns:
-        None: The function does not return anything. It processes the response and saves the retrieved judgments to a file.
+        dict: The verification report (res_num, rows (distinct verdicts), page_rows, missing, short, complete, rounds, refetched, removed, errors).
     """
-    
-    count = 0 # local count for paging
+    manifest_file = settings.manifest_file_for(year_search)
+    key = manifest_key(input_search, filters)
+    if recheck:
+        update_manifest_entry(settings.verdicts_dir, manifest_file, key, res_num=None, total_pages=None)
+
+    def fetch_pages(pages:list) -> int:
+        return get_administrative_judgment(input_search, year_search, settings, sentence_file_name, filters, pages=pages)
+
+    with span("verify", query=key, year=year_search):
+        report = verify_crawl(settings.verdicts_dir, manifest_file, key, sentence_file_name.replace("Y", str(year_search)), csv_result_header,
+                              settings.paging, fetch_pages, settings.partition_workers)
+    print(f">> Verification of '{key}' ({year_search})")
+    print(f"Results: {'not read' if report['res_num'] is None else report['res_num']}, verdicts collected: {report['rows']} (rows by page: {report['page_rows']})")
+    print(f"Pages fetched again: {report['refetched']} in {report['rounds']} rounds, duplicated rows removed: {report['removed']}")
+    for pages, error in report["errors"]:
+        print(f"WARNING! Pages {pages} not fetched: {error}")
+    if report["complete"]:
+        print("Crawl complete")
+    elif report["res_num"] is None:
+        print("WARNING! Crawl not complete: the results number (page 0) could not be read")
+    elif report["missing"] or report["short"]:
+        print(f"WARNING! Crawl not complete: missing pages {report['missing']}, short pages {report['short']}")
+    else: # every page has its rows, but some verdicts are on two pages and others on none
+        print(f"WARNING! Crawl not complete: {report['rows']} distinct verdicts for {report['res_num']} results (the results changed during the crawl, run it again)")
+    print()
+    update_manifest_entry(settings.verdicts_dir, manifest_file, key, rows=report["rows"], complete=report["complete"], verified=report["complete"])
+    return report
 
-    sentence_list_obj = [] # reset the list of found sentence
-    
-    html_content = bs(response.text, 'html.parser')
+def refresh_index(settings) -> None:
+    """
+    Load the rows added to the year index files into the SQLite verdicts index (only the new rows are read).
 
-    articles_num = len(html_content.findAll("article")) - 1 # -1 because the last article is not a verdicts
+    Args:
+        settings (config.config_reader.Settings): The validated settings.
 
-    print("Articles (number of sentences) in this page:", str(articles_num))
+    Returns:
+        None
+    """
+    from index_manager.verdict_index import VerdictIndex
 
+    print(">> Refreshing the verdicts index")
+    with VerdictIndex(settings.index_db_path()) as index:
+        loaded = index.refresh(settings.verdicts_dir, settings.verdicts_file)
+    for year, rows in loaded.items():
+        print(f"Year {year}: {rows} new rows indexed")
     print()
 
-    # for each <article> (a verdict) extract the data (location, link, ECLI, etc...)
-    for article in html_content.findAll("article"):
-        count+=1 # increment local count of download (for the paging)
-        verdicts_download_count+=1 # increment global count (for the whole download)
+def scrape(input_search:str, year_search:int, settings, from_cache:bool=False) -> None:
+    """
+    Crawl all the result pages of a query for a year and write the verdicts index CSV.
 
-        # if (count > paging): # it it's over the paging save it to csv (does not work fot he last page with less articles)
-        if (count > articles_num):
-            print("Results parsed for this page:", count-1)
-            print("-> Total sentences parsed until this page:", verdicts_download_count-1)
+    Args:
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        settings (config.config_reader.Settings): The validated settings.
+        from_cache (bool): Re-parse the cached pages, page 0 included (a live crawl always requests page 0).
 
-            # write sentences to CSV
-            print("Writing CSV file sentences...")
-            for a_sentence in sentence_list_obj:
-                sentence_csv = a_sentence.toCSV() # stream a verdicts from obj to csv string
+    Returns:
+        None
+    """
+    verdict_dir = settings.verdicts_dir
+    verdict_file_name = settings.verdicts_file
 
-                file_name = sentence_file_name.replace("Y", str(year_search))
-                csv_file_path = Path(verdict_dir) / file_name
+    # create the output directories
+    print(">> Creating output directories")
+    print(f"Creating '{verdict_dir}' directory")
+    check_and_create_directory(verdict_dir)
+    print(f"Creating '{verdict_dir}/{year_search}' directory")
+    check_and_create_directory(str(year_search), verdict_dir)
+    print()
 
-                with open(csv_file_path, mode="a") as fp:
-                    fp.write(f"{page};{sentence_csv}\n")
+    print(">> Starting the mechanicalsoup")
+    print("URL:",settings.url_search)
+    print("Year:",year_search)
+    print("Query:",input_search)
+    print("Saved session:", "reused if still valid" if get_session_store().enabled else "disabled") # the browser is opened on the first page not in the cache
+    print()
 
-            print()
+    # Crawl the IAJ website
+    get_administrative_judgment(input_search, year_search, settings, verdict_file_name, from_cache=from_cache)
+    print()
 
-            # submit a new page
-            if (page == 0): # if it's in page 0, move of a shift to start to a new paging, else move of 1
-                page=page+page_increment
-            else:
-                page=page+1
+    # Reconcile the rows with the results number, fetching again only the missing pages
+    verify(input_search, year_search, settings, verdict_file_name)
 
-            print()
-            print("New page -->", str(page))
+    cache = get_page_cache()
+    if cache.enabled:
+        print(">> Page cache")
+        print(f"Pages read from the cache: {cache.hits}, pages requested: {cache.misses}")
+        print()
+    
+    # Add the header
+    print(">> Adding CSV header to results")
+    file_name = settings.verdicts_file_for(year_search)
+    add_csv_header(verdict_dir, file_name, csv_result_header)
+    print()
 
-            if (page > total_pages): # if the new page it's over the total pages stop it
-                print("Web scraper finished")
-                print("Year:", year_search)
-                print()
-                return
-            else:
-                get_administrative_judgment(input_search, page, year_search, browser, paging, sentence_file_name, total_pages, verdicts_download_count, page_increment)
-
-        verdict = Verdict() # create a new verdict object and extract the data from <article>
-
-        print(f"Result [{str(count)}] / page [{str(page)}]")
-        # print(type(article.get("class"))) # the class is a list so [0] is the first attribute searched
-        if (article.get("class")[0] == "ricerca--item"):
-            for link in article.findAll("a"):
-                if (link.get("data-sede") != None):
-                    # print(link["data-sede"]) # code of the tribunal
-                    verdict.tribunal_code = link["data-sede"]
-                    # print(link["href"])
-                    # verdict.sentence_url = url + link["href"] # OLD URL, from 2022 it's changed and it's complete in the href
-                    verdict.sentence_url = link["href"]
-                    string_href = link["href"].split("&")
-                    string_file_name = string_href[3].split("=")
-                    string_file = link["data-sede"] + "_" + string_file_name[1]
-                    # print(string_file)
-                    verdict.sentence_filename = string_file
-        div_count = 0
-        for div in article.findAll("div", {"class": "col-sm-12"}):
-            div_count+=1
-            if (div_count==1): # title from the second div
-                a_count = 0
-                for ahref in div.findAll("a"):
-                    a_count+=1
-                    if (a_count==2):
-                        # print(ahref.string)
-                        verdict.sentence_title = ahref.string
-            if (div_count==2): # type, city, section, number
-                # print(div)
-                bcount = 0
-                for b in div.findAll("b"):
-                    bcount+=1
-                    # print(b.string)
-                    if (bcount==1):
-                        verdict.sentence_type = b.string
-                    if (bcount==2):
-                        verdict.tribunal_city = b.string
-                    if (bcount==3):
-                        verdict.tribunal_section = b.string
-                    if (bcount==4):
-                        verdict.sentence_number = b.string
-            # div_count==3 not needed
-            if (div_count==4): # recourse number
-                # print(div)
-                for b in div.findAll("b"):
-                    # print(b.string)
-                    verdict.recourse_number = b.string
-            if (div_count==5): # ecli
-                # print(div)
-                for b in div.findAll("b"):
-                    # print(b.string)
-                    verdict.sentence_ecli = b.string
-            else:
-                verdict.sentence_ecli = None
+    refresh_index(settings)
+
+def scrape_partition(input_search:str, year_search:int, settings, label:str, filters:dict, from_cache:bool=False) -> tuple:
+    """
+    Crawl one partition of a query (its own browser and page chain) into a partition index file.
+
+    Args:
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        settings (config.config_reader.Settings): The validated settings.
+        label (str): The partition label (court code or date window).
+        filters (dict): The extra form fields of the partition.
+        from_cache (bool): Re-parse the cached pages, page 0 included.
+
+    Returns:
+        tuple: The partition index file name (with the 'Y' placeholder), the verification report of the partition.
+    """
+    part_file_name = partition_file_name(settings.verdicts_file, label)
+    part_path = Path(settings.verdicts_dir) / part_file_name.replace("Y", str(year_search))
+    part_path.unlink(missing_ok=True) # a partition is always crawled from its first page
+    get_administrative_judgment(input_search, year_search, settings, part_file_name, filters, from_cache=from_cache)
+    report = verify(input_search, year_search, settings, part_file_name, filters)
+    return part_file_name, report
+
+def read_results_number(input_search:str, year_search:int, settings) -> int:
+    """
+    Read the results number of the whole (unpartitioned) query from its page 0, to cross-check the partitions.
+
+    Args:
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        settings (config.config_reader.Settings): The validated settings.
+
+    Returns:
+        int: The results number, or None if page 0 could not be read.
+    """
+    import mechanicalsoup
+    import requests
+
+    stream = VerdictStream(input_search, year_search, settings, pages=[]) # page 0 only
+    try:
+        for _ in stream.pages():
+            pass
+    except (mechanicalsoup.LinkNotFoundError, requests.RequestException) as e:
+        print(f"WARNING! Results number of '{input_search}' not read: {e}")
+    return stream.res_num
+
+def scrape_partitioned(input_search:str, year_search:int, settings, partition_by:str, windows:int=12, from_cache:bool=False) -> None:
+    """
+    Crawl a query split in partitions (by court or by date window) in parallel, then merge the partitions
+    in the year index deduplicated by ECLI.
+
+    Args:
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        settings (config.config_reader.Settings): The validated settings.
+        partition_by (str): 'court' (courts from the courts CSV) or 'date' (date windows of the year).
+        windows (int): The number of date windows (partition_by 'date').
+        from_cache (bool): Re-parse the cached pages, page 0 included.
+
+    Returns:
+        None
+    """
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+
+    verdict_dir = settings.verdicts_dir
+
+    print(">> Creating output directories")
+    check_and_create_directory(verdict_dir)
+    check_and_create_directory(str(year_search), verdict_dir)
+    print()
+
+    if partition_by == "court":
+        partitions = court_partitions(read_courts(settings.courts_dir, settings.courts_file), settings.form_court_field)
+    elif partition_by == "date":
+        partitions = date_partitions(year_search, windows, settings.form_date_from_field, settings.form_date_to_field, settings.form_date_format)
+    else:
+        raise ValueError(f"Unknown partition '{partition_by}', expected 'court' or 'date'")
+
+    print(">> Results of the whole query")
+    res_num = read_results_number(input_search, year_search, settings)
+    print()
 
-        print(verdict.toString())
-        if (page==0): # it is the first running (page_increment = 1), the page 0 is needed in the list
-            if (page_increment==1):
-                sentence_list_obj.append(verdict) # add a verdict to the list
-        else:
-            sentence_list_obj.append(verdict) # add a verdict to the list
+    print(f">> Crawling {len(partitions)} partitions by {partition_by} ({settings.partition_workers} in parallel)")
+    get_page_cache() # created once, shared by the partitions
+    part_files = []
+    incomplete = []
+    partition_results = 0
+    partition_rows = 0
+    with ThreadPoolExecutor(max_workers=settings.partition_workers) as executor:
+        futures = {executor.submit(scrape_partition, input_search, year_search, settings, label, filters, from_cache): label for label, filters in partitions}
+        for future in as_completed(futures):
+            label = futures[future]
+            try:
+                part_file_name, report = future.result()
+                part_files.append(part_file_name.replace("Y", str(year_search)))
+                partition_results += report["res_num"] or 0
+                partition_rows += report["rows"]
+                if not report["complete"]:
+                    incomplete.append(label)
+                print(f"Partition '{label}' completed")
+            except Exception as e:
+                print(f"WARNING! Partition '{label}' failed: {e}")
+    print()
+
+    print(">> Merging the partitions")
+    file_name = settings.verdicts_file_for(year_search)
+    merged, duplicates = merge_partition_files(verdict_dir, file_name, sorted(part_files), csv_result_header)
+    print("Rows merged:", merged)
+    print("Duplicated rows skipped (same ECLI):", duplicates)
+    print(f"Results of the partitions: {partition_results}, rows: {partition_rows}, results of the whole query: {res_num}")
+    if incomplete:
+        print("WARNING! Partitions not complete:", ", ".join(sorted(incomplete)))
+    if res_num is None:
+        print("WARNING! Results number of the whole query not read, the partitions cannot be cross-checked")
+    elif partition_results != res_num or partition_rows != res_num:
+        # fewer results: the partitions do not cover the query; more: they overlap, e.g. a filter ignored by the website returns everything
+        print(f"WARNING! The partitions do not match the whole query ({partition_results} results and {partition_rows} rows, {res_num} expected)")
+    complete = len(part_files) == len(partitions) and not incomplete and res_num is not None and partition_results == res_num and partition_rows == res_num
+    update_manifest_entry(verdict_dir, settings.manifest_file_for(year_search), input_search, partitioned_by=partition_by, partitions=len(partitions),
+                          res_num=res_num, rows=partition_rows, complete=complete, verified=complete)
+    print()
+
+    print(">> Adding CSV header to results")
+    add_csv_header(verdict_dir, file_name, csv_result_header)
+    print()
+
+    refresh_index(settings)
 
 ### MAIN ###
 def main():
@@ -296,45 +406,48 @@ def main():
     print()
 
     print(">> Query input")
-    if len(sys.argv) > 2:
-        input_search = sys.argv[1]
-        year_search = int(sys.argv[2])
+    try:
+        argv, config_file, overrides = pop_cli_overrides(sys.argv[1:])
+        argv, profile_mode, profile_window = pop_profile_options(argv)
+        settings = get_settings(config_file, overrides)
+    except ValueError as e:
+        print(f"WARNING! Invalid configuration: {e}")
+        print(f"Use example: {script_name} 'appalt*' 2023 [--partition court|date] [--from-cache] [--profile [trace|cprofile|sample]] [--profile-window 60] [--config <file.yml>] [--set PAGING=30]")
+        print()
+        quit()
+    partition_by = None
+    if "--partition" in argv:
+        position = argv.index("--partition")
+        partition_by = argv[position + 1] if position + 1 < len(argv) else None
+        del argv[position:position + 2]
+    from_cache = "--from-cache" in argv
+    if from_cache:
+        argv.remove("--from-cache")
+    if len(argv) > 1 and partition_by in (None, "court", "date"):
+        input_search = argv[0]
+        year_search = int(argv[1])
         print("Query:", input_search)
         print("Year:", year_search)
+        print("Partition by:", partition_by or "none")
+        print("Pages from the cache:", "all (re-parse)" if from_cache else "only if page 0 has the same results")
     else:
-        print("WARNING! Query and/or Year input missing, quitting the program.")
-        print(f"Use example: {script_name} 'appalt*' 2023")
+        print("WARNING! Query and/or Year input missing (or unknown partition), quitting the program.")
+        print(f"Use example: {script_name} 'appalt*' 2023 [--partition court|date] [--from-cache] [--profile [trace|cprofile|sample]] [--profile-window 60] [--config <file.yml>] [--set PAGING=30]")
         print()
         quit()
     print()
 
-    # create the output directories
-    print(">> Creating output directories")
-    print(f"Creating '{verdict_dir}' directory")
-    check_and_create_directory(verdict_dir)
-    print(f"Creating '{verdict_dir}/{year_search}' directory")
-    check_and_create_directory(str(year_search), verdict_dir)
-    print()
-
-    print(">> Starting the mechanicalsoup")
-    browser = mechanicalsoup.StatefulBrowser() # web scraper object
-    # print(type(browser)) # <class 'mechanicalsoup.stateful_browser.StatefulBrowser'>
-    browser.open(url_search)
-    browser.follow_link("dcsnprr") # moves to <url>/dcsnprr
-    print("URL:",browser.get_url())
-    print("Year:",year_search)
-    print("Query:",input_search)
-    print()
+    if profile_mode:
+        start_profiling(profile_mode, profile_window, settings.profile_dir)
 
-    # Crawl the IAJ website
-    get_administrative_judgment(input_search, 0, year_search, browser, paging, verdict_file_name, total_pages, verdicts_download_count, page_increment)
-    print()
-    
-    # Add the header
-    print(">> Adding CSV header to results")
-    file_name = verdict_file_name.replace("Y", str(year_search))
-    add_csv_header(verdict_dir, file_name, csv_result_header)
-    print()
+    try:
+        with span("scrape", query=input_search, year=year_search):
+            if partition_by:
+                scrape_partitioned(input_search, year_search, settings, partition_by, from_cache=from_cache)
+            else:
+                scrape(input_search, year_search, settings, from_cache)
+    finally: # the profile of a failed or interrupted run is written too
+        finish_profiling()
 
     end_time = datetime.now().replace(microsecond=0)
     delta_time = end_time - start_time
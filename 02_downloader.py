@@ -2,21 +2,27 @@
 # DOWNLOADER: from the CSV execute the wget and save it
 
 ### IMPORT ### 
+# pandas and requests are imported inside the functions that use them (fast start for argument errors)
+from __future__ import annotations
 from datetime import datetime
-import pandas as pd
+from os import replace as os_replace
 from pathlib import Path
-import requests
 import sys 
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 ### LOCAL IMPORT ###
-from config.config_reader import read_config_yaml
+from config.config_reader import get_settings, pop_cli_overrides
+from download_manager.integrity import IntegrityStore, check_content
+from download_manager.scheduler import deadline_report, parse_court_weights, parse_job, schedule_downloads
+from download_manager.work_set import compute_work_set, list_directory_files
+from utility_manager.profiler import finish_profiling, pop_profile_options, span, start_profiling
 from utility_manager.utilities import check_and_create_directory, script_info
 
 ### GLOBALS ###
-yaml_config = read_config_yaml()
-verdict_dir = str(yaml_config["VERDICTS_DIR"])
-verdict_cols = ["sentenza_url", "sentenza_file"] # columns needed from CSV
-verdict_file_name = str(yaml_config["VERDICTS_FILE"])
+verdict_cols = ["sentenza_numero", "tribunale_codice", "sentenza_url", "sentenza_file"] # columns needed from CSV (court and number for the priority)
 
 script_path, script_name = script_info(__file__)
 
@@ -38,6 +44,8 @@ def data_load(verdict_dir: str, file_name: str, delimiter: str, usecols:list, re
     Returns:
         pd.DataFrame: A DataFrame loaded with specified columns from the CSV file.
     """
+    import pandas as pd
+
     path_input = Path(verdict_dir) / file_name
     
     try:
@@ -78,68 +86,93 @@ def data_show(input_df:pd.DataFrame) -> None:
     print()
     return
 
-def get_sentence_file(url_download, file_download, year, verdict_dir):
+def get_sentence_file(url_download, file_download, year, verdict_dir, store:IntegrityStore=None):
     """
     Download the sentence file if it does not already exist in the specified directory.
+    The content is checked (format, Content-Length) before being written, so error pages and truncated
+    responses are not saved, and the file is written atomically.
 
     Args:
         url_download (str): URL from which to download the file.
         file_download (str): Name of the file to download.
         year (int or str): Year to categorize the file under.
         verdict_dir (str): Base directory to store the files.
+        store (IntegrityStore): Integrity database recording size, Content-Length and hash of the download (optional).
         
     Returns:
         bool: True if a new file was downloaded, False if the file was already present.
     """
+    import requests
+
     path_file = Path(verdict_dir) / str(year) / file_download
     path_file.parent.mkdir(parents=True, exist_ok=True)  # Ensure the directory exists
     
     if not path_file.exists():  # Check if the file already exists
         try:
-            response = requests.get(url_download, verify=False)  # Security warning: verify should ideally be True
+            with span("get_sentence_file.request", file=file_download):
+                response = requests.get(url_download, verify=False)  # Security warning: verify should ideally be True
             response.raise_for_status()  # Raise an exception for HTTP errors
-            with open(path_file, 'wb') as f:
-                f.write(response.content)
-            print(f"File downloaded: {path_file}")
-            return True
         except requests.RequestException as e:
             print(f"Failed to download the file: {e}")
             return False
+        content = response.content
+        content_length = response.headers.get("Content-Length")
+        content_length = int(content_length) if content_length and content_length.isdigit() and "Content-Encoding" not in response.headers else None
+        if content_length is not None and content_length != len(content):
+            print(f"Failed to download the file: truncated response ({len(content)} of {content_length} bytes)")
+            return False
+        reason = check_content(file_download, content[:4096], content[-1024:], len(content))
+        if reason:
+            print(f"Failed to download the file: {reason}")
+            return False
+        with span("get_sentence_file.write", file=file_download, bytes=len(content)):
+            temp_path_file = path_file.with_name(path_file.name + '.temp')
+            with open(temp_path_file, 'wb') as f:
+                f.write(content)
+            os_replace(temp_path_file, path_file)
+        if store is not None:
+            store.record_download(int(year), file_download, content, content_length)
+        print(f"File downloaded: {path_file}")
+        return True
     else:
         print(f"File already downloaded: {path_file}")
         return False
 
-### MAIN ###
-def main():
-    print()
-    print(f"*** PROGRAM START ({script_name}) ***")
-    print()
+def download(year_start:int, year_end:int, settings, limit:int=None, jobs:list=None) -> tuple:
+    """
+    Download the files listed in the verdicts index of each year in [year_start, year_end).
+    The files of all the years are queued by priority (court weights, year, recency and deadline jobs)
+    and downloaded at the DOWNLOAD_RATE budget.
 
-    start_time = datetime.now().replace(microsecond=0)
+    Args:
+        year_start (int): First year to be downloaded.
+        year_end (int): Year after the last one to be downloaded.
+        settings (config.config_reader.Settings): The validated settings.
+        limit (int): Maximum number of files to be downloaded in this run (optional).
+        jobs (list): Deadline jobs, e.g. [parse_job('cds:2023@2026-10-20T18:00')] (optional).
 
-    print("Start process:", start_time)
-    print()
+    Returns:
+        tuple: (files downloaded, files not downloaded).
+    """
+    import time
+    import pandas as pd
 
-    print(">> Year input")
-    if len(sys.argv) > 1:
-        year_start = int(sys.argv[1])
-        year_end = year_start + 1
-        print("Value:", year_start)
-    else:
-        print("WARNING! Year input missing, quitting the program.")
-        print(f"Use example: {script_name} 2023")
-        print()
-        quit()
-    print()
+    verdict_dir = settings.verdicts_dir
+    jobs = jobs or []
 
     # OUTPUT
     file_downloaded = 0 # total file downloaded from the wget
-    file_not_downloaded = 0 # total file already saved in file system
+    file_not_downloaded = 0 # total file not downloaded (already saved in file system, duplicated in the index or failed)
+    file_present = 0 # total file already saved in file system
+    file_duplicated = 0 # total rows of the index listing a file already listed
+    file_failed = 0 # total download errors
+    file_deferred = 0 # total file left for the next run (limit)
 
+    queue = [] # files to be downloaded of each year
     for year in range(year_start, year_end):
 
         print(">> Loading data")
-        file_input = verdict_file_name.replace("Y", str(year))
+        file_input = settings.verdicts_file_for(year)
         print("Year:", year)
         print("File with verdicts index:", file_input)
         print()
@@ -151,40 +184,138 @@ def main():
         print()
 
         print(">> Reading the verdicts index")
-        input_df = data_load(verdict_dir, file_input, ";", verdict_cols, True)
+        input_df = data_load(verdict_dir, file_input, ";", verdict_cols, False) # duplicated rows are counted by compute_work_set
         print()
 
         print("Input DF:")
         data_show(input_df)
         print()
 
-        n = len(input_df)
-
-        i = 0
-
-        print(">> Downloading data")
-        for row in input_df.itertuples():
-            print(f"[{i} / {n}] - year: {year}")
-            url_download = row[1]
-            file_donwload = row[2]
-            print("URL:", url_download)
-            print("File:", file_donwload)
-            # get_sentence_file(url_download, file_donwload, year)
-            downloaded = get_sentence_file(url_download, file_donwload, year, verdict_dir)
-            if downloaded:
-                file_downloaded+=1
-                print("OK! Download was successful.")
-            else:
-                file_downloaded+=1
-                print("WARNING! No download needed or error.")
-            print()
-            i+=1
+        if len(input_df) == 0:
+            continue
+
+        print(">> Planning the downloads")
+        with span("plan_downloads", year=year):
+            present_files = list_directory_files(Path(verdict_dir) / str(year)) # one directory listing
+            download_df, counts = compute_work_set(input_df, present_files)
+        print("Rows in the index:", counts["rows"])
+        print("Duplicated rows (same file):", counts["duplicates"])
+        print("Files already downloaded:", counts["already_present"])
+        print("Files to be downloaded:", counts["to_download"])
+        print()
+        file_present += counts["already_present"]
+        file_duplicated += counts["duplicates"]
+        queue.append(download_df.assign(anno=year))
+
+    print(">> Scheduling the downloads")
+    with span("schedule_downloads"):
+        queue_df = pd.concat(queue) if queue else pd.DataFrame(columns=verdict_cols + ["anno"])
+        download_df = schedule_downloads(queue_df, parse_court_weights(settings.download_court_weights), settings.download_year_decay, settings.download_recency_weight, jobs)
+    for job, files, last, finish, met in deadline_report(download_df, jobs, settings.download_rate):
+        status = "no estimate" if finish is None else f"done by {finish.replace(microsecond=0)}" + ("" if met else " - WARNING! after the deadline")
+        if limit is not None and last is not None and last >= limit:
+            status += f" (beyond the limit of {limit} files of this run)"
+        print(f"Job {job['spec']}: {files} files, {status}")
+    if limit is not None and len(download_df) > limit:
+        file_deferred = len(download_df) - limit
+        download_df = download_df.iloc[:limit]
+    print("Files queued:", len(download_df))
+    print("Files left for the next run (limit):", file_deferred)
+    print("Queue by court (first 10):", download_df["tribunale_codice"].value_counts().head(10).to_dict())
+    print()
+
+    store = IntegrityStore(settings.integrity_db_path()) # download records, checked by 'iaj.py scan'
+    n = len(download_df)
+    interval = 1.0 / settings.download_rate if settings.download_rate > 0 else 0.0
+    next_start = time.monotonic()
+
+    print(">> Downloading data")
+    for i, row in enumerate(download_df.itertuples(index=False)):
+        if interval: # rate budget
+            time.sleep(max(next_start - time.monotonic(), 0.0))
+            next_start = max(next_start, time.monotonic()) + interval
+        year = row.anno
+        print(f"[{i} / {n}] - year: {year} - court: {row.tribunale_codice}")
+        url_download = row.sentenza_url
+        file_donwload = row.sentenza_file
+        print("URL:", url_download)
+        print("File:", file_donwload)
+        downloaded = get_sentence_file(url_download, file_donwload, year, verdict_dir, store)
+        if downloaded:
+            file_downloaded+=1
+            print("OK! Download was successful.")
+        else:
+            file_failed+=1
+            print("WARNING! No download needed or error.")
+        print()
+    store.close()
     print()
 
+    file_not_downloaded = file_present + file_duplicated + file_failed + file_deferred
+
     print(">> Download results")
     print("Files downloaded:", file_downloaded)
     print("Files not downloaded (error or already downloaded):", file_not_downloaded)
+    print("- already downloaded:", file_present)
+    print("- duplicated in the index:", file_duplicated)
+    print("- errors:", file_failed)
+    print("- left for the next run:", file_deferred)
+    print()
+
+    return file_downloaded, file_not_downloaded
+
+### MAIN ###
+def main():
     print()
+    print(f"*** PROGRAM START ({script_name}) ***")
+    print()
+
+    start_time = datetime.now().replace(microsecond=0)
+
+    print("Start process:", start_time)
+    print()
+
+    print(">> Year input")
+    try:
+        argv, config_file, overrides = pop_cli_overrides(sys.argv[1:])
+        argv, profile_mode, profile_window = pop_profile_options(argv)
+        settings = get_settings(config_file, overrides)
+        limit = None
+        jobs = []
+        while "--limit" in argv or "--job" in argv: # --limit <files>, --job COURT[:YEAR]@DEADLINE (repeatable)
+            option = "--limit" if "--limit" in argv else "--job"
+            position = argv.index(option)
+            value = argv[position + 1] if position + 1 < len(argv) else ""
+            del argv[position:position + 2]
+            if option == "--limit":
+                limit = int(value)
+            else:
+                jobs.append(parse_job(value))
+    except ValueError as e:
+        print(f"WARNING! Invalid configuration: {e}")
+        print()
+        quit()
+    if len(argv) > 0:
+        year_start = int(argv[0])
+        year_end = year_start + 1
+        print("Value:", year_start)
+        print("Limit:", limit if limit is not None else "none")
+        print("Jobs:", [job["spec"] for job in jobs])
+    else:
+        print("WARNING! Year input missing, quitting the program.")
+        print(f"Use example: {script_name} 2023 [--limit 500] [--job cds:2023@2026-10-20T18:00] [--profile [trace|cprofile|sample]] [--profile-window 60] [--config <file.yml>] [--set VERDICTS_DIR=verdicts]")
+        print()
+        quit()
+    print()
+
+    if profile_mode:
+        start_profiling(profile_mode, profile_window, settings.profile_dir)
+
+    try:
+        with span("download", year=year_start):
+            download(year_start, year_end, settings, limit, jobs)
+    finally: # the profile of a failed or interrupted run is written too
+        finish_profiling()
 
     end_time = datetime.now().replace(microsecond=0)
     delta_time = end_time - start_time
@@ -2,23 +2,17 @@
 # Analyze the downloaded files
 
 from datetime import datetime
-import pandas as pd
 from pathlib import Path
 import json
+import sys
 
 ### LOCAL IMPORT ###
-from verdict import Verdict 
-from config.config_reader import read_config_yaml
+from analyzer_manager.snapshot import analyze_directory, load_snapshot, save_snapshot
+from config.config_reader import get_settings, pop_cli_overrides
+from utility_manager.profiler import finish_profiling, pop_profile_options, span, start_profiling
 from utility_manager.utilities import check_and_create_directory, script_info
-from collections import defaultdict
 
 ### GLOBALS ###
-yaml_config = read_config_yaml()
-verdict_dir = str(yaml_config["VERDICTS_DIR"])
-verdict_stats_dir = str(yaml_config["VERDICTS_STATS"])
-verdict_stats_file = str(yaml_config["VERDICTS_STATS_FILE"])
-courts_dir = str(yaml_config["COURTS_DIR"])
-courts_file = str(yaml_config["COURTS_FILE"])
 script_path, script_name = script_info(__file__)
 
 # dictionaries of the files found
@@ -26,9 +20,8 @@ court_dic = {}
 year_dic = {}
 ext_dic = {}
 
-# court info
-court_dir = "court"
-court_file = "court.csv"
+# time-series CSV of the analyses (one row per directory and run)
+timeseries_header = ["analyzed_at", "directory", "total_files", "added", "removed", "changed", "corrupt_files"]
 
 ### FUNCTIONS ###
 
@@ -44,6 +37,8 @@ def court_load(court_dir: str, court_file:str) -> list:
         list of elements from the first column of the CSV.
     """
 
+    import pandas as pd
+
     try:
         file_path = Path(court_dir) / court_file
         df = pd.read_csv(file_path)
@@ -76,50 +71,6 @@ def list_subdirectories(directory_path:str) -> list:
     subdirectories = [subdir for subdir in path.iterdir() if subdir.is_dir()]
     return subdirectories
 
-def count_file_extensions(directory_path:str, court_prefixes:list) -> dict:
-    """
-    Count file extensions in the given directory, exclude temporary MacOS files that start with '._',
-    count files starting with specified court_prefixes, and include the total number of files. 
-    The function returns a dictionary with the directory path, a sub-dictionary for extensions,
-    the counts for specified court_prefixes, and the total file count.
-
-    Args:
-        directory_path (str): The path to the directory to search for files.
-        court_prefixes (list): A list of string court_prefixes to count files that start with them.
-
-    Returns:
-        dict: A dictionary containing the directory path, a dictionary with extensions as keys and their counts as values,
-        a dictionary with court_prefixes as keys and their counts as values, and the total number of files.
-    """
-    result = None
-    path = Path(directory_path)
-    extension_count = defaultdict(int)
-    prefix_count = defaultdict(int)
-    total_files = 0  # Initialize a counter for the total number of files
-    
-    # Iterate over all files in the directory using .rglob('*') to include all files
-    for file in path.rglob('*'):
-        # Check if the path is a file and not a MacOS temporary file
-        if file.is_file() and not file.name.startswith('._'):
-            total_files += 1  # Increment the total file counter
-            # Get the file extension in lowercase and update the count
-            extension = file.suffix[1:].lower()
-            extension_count[extension] += 1
-            # Count files starting with specified court_prefixes
-            for prefix in court_prefixes:
-                if file.name.startswith(prefix):
-                    prefix_count[prefix] += 1
-
-    # Prepare the result dictionary with the directory path, the extension counts, the prefix counts, and the total file count
-    result = {
-        "directory_path": str(path),
-        "extensions": dict(extension_count),
-        "court_counts": dict(prefix_count),
-        "total_files": total_files
-    }
-
-    return result
-
 def save_results_to_file(result:dict, output_directory:str, output_filename:str) -> int:
     """
     Save the results dictionary to a file in a specified directory as a JSON list.
@@ -165,16 +116,44 @@ def save_results_to_file(result:dict, output_directory:str, output_filename:str)
     
     return 0
 
-### MAIN ###
-def main():
-    print()
-    print(f"*** PROGRAM START ({script_name}) ***")
-    print()
+def append_timeseries(output_directory:str, output_filename:str, rows:list) -> None:
+    """
+    Append rows to the time-series CSV of the analyses (one row per directory and run, header written with the first row).
 
-    start_time = datetime.now().replace(microsecond=0)
+    Args:
+        output_directory (str): The stats directory.
+        output_filename (str): The time-series CSV file name.
+        rows (list): Rows (lists of values) in the order of timeseries_header.
 
-    print("Start process:", start_time)
-    print()
+    Returns:
+        None
+    """
+    file_path = Path(output_directory) / output_filename
+    new_file = not file_path.exists() or file_path.stat().st_size == 0
+    with open(file_path, 'a') as fp:
+        if new_file:
+            fp.write(";".join(timeseries_header) + "\n")
+        for row in rows:
+            fp.write(";".join(str(value) for value in row) + "\n")
+
+def analyze(settings, full:bool=False) -> None:
+    """
+    Count the files of each verdict directory and append the results to the stats file.
+    The counts are updated from the snapshot of the previous analysis: only the directories changed since then
+    are listed again, and the files added, removed and changed are reported by court and extension.
+
+    Args:
+        settings (config.config_reader.Settings): The validated settings.
+        full (bool): List every directory again instead of trusting the unchanged directory mtimes.
+
+    Returns:
+        None
+    """
+    verdict_dir = settings.verdicts_dir
+    verdict_stats_dir = settings.verdicts_stats
+    verdict_stats_file = settings.verdicts_stats_file
+    court_dir = settings.courts_dir
+    court_file = settings.courts_file
 
     print(">> Creating output directories")
     print(f"Creating '{verdict_stats_dir}' directory")
@@ -196,21 +175,84 @@ def main():
     print(verdicts_dir_list)
     print()
 
+    snapshot_path = Path(verdict_stats_dir) / settings.verdicts_snapshot_file
+    snapshot = load_snapshot(snapshot_path)
+    previous_dirs = snapshot.get("directories", {})
+    print(">> Loading the snapshot of the previous analysis")
+    print("Snapshot file:", snapshot_path)
+    print("Directories in the snapshot:", len(previous_dirs), "(full listing)" if full else "")
+    print()
+
+    corrupt_counts = {}
+    if settings.integrity_db_path().exists(): # corrupt files found by the last 'iaj.py scan'
+        from download_manager.integrity import IntegrityStore
+        with IntegrityStore(settings.integrity_db_path()) as store:
+            corrupt_counts = store.corrupt_counts()
+
+    analyzed_at = datetime.now().replace(microsecond=0).isoformat()
+    directories = {}
+    timeseries_rows = []
 
     print(">> Analysis of individual verdict directories")
     print()
     for v_dir in verdicts_dir_list:
         print("Verdict directory:", v_dir)
-        dic_result_by_year = count_file_extensions(v_dir, list_court)
+        with span("analyze_directory", directory=str(v_dir)):
+            entry, delta = analyze_directory(v_dir, previous_dirs.get(str(v_dir), {}), list_court, full)
+        directories[str(v_dir)] = entry
+        dic_result_by_year = {"directory_path": str(v_dir), **entry["counts"], "analyzed_at": analyzed_at,
+                              "delta": {key: delta[key] for key in ("added", "removed", "changed", "by_court", "by_extension")}}
+        if v_dir.name.isdigit() and int(v_dir.name) in corrupt_counts:
+            dic_result_by_year["corrupt_files"] = corrupt_counts[int(v_dir.name)]
         print(dic_result_by_year)
         print("Total files in the directory:", dic_result_by_year["total_files"])
+        print(f"Since the previous analysis: {delta['added']} added, {delta['removed']} removed, {delta['changed']} changed ({delta['dirs_listed']} directories listed, {delta['dirs_reused']} unchanged)")
+        if "corrupt_files" in dic_result_by_year:
+            print("Corrupt files in the directory (last scan):", dic_result_by_year["corrupt_files"])
         ok = save_results_to_file(dic_result_by_year, verdict_stats_dir, verdict_stats_file)
         if ok == 1:
             print(f"OK! Result saved in '{verdict_stats_file}'")
         else:
             print(f"WARNING! Result not saved in '{verdict_stats_file}'")
+        timeseries_rows.append([analyzed_at, v_dir.name, dic_result_by_year["total_files"], delta["added"], delta["removed"], delta["changed"], dic_result_by_year.get("corrupt_files", "")])
         print()
 
+    print(">> Saving the snapshot and the time series")
+    save_snapshot(snapshot_path, {"analyzed_at": analyzed_at, "directories": directories})
+    append_timeseries(verdict_stats_dir, settings.verdicts_timeseries_file, timeseries_rows)
+    print("Snapshot file:", snapshot_path)
+    print("Time-series file:", Path(verdict_stats_dir) / settings.verdicts_timeseries_file)
+    print()
+
+### MAIN ###
+def main():
+    print()
+    print(f"*** PROGRAM START ({script_name}) ***")
+    print()
+
+    start_time = datetime.now().replace(microsecond=0)
+
+    print("Start process:", start_time)
+    print()
+
+    try:
+        argv, config_file, overrides = pop_cli_overrides(sys.argv[1:])
+        argv, profile_mode, profile_window = pop_profile_options(argv)
+        settings = get_settings(config_file, overrides)
+    except ValueError as e:
+        print(f"WARNING! Invalid configuration: {e}")
+        print()
+        quit()
+
+    if profile_mode:
+        start_profiling(profile_mode, profile_window, settings.profile_dir)
+
+    try:
+        with span("analyze"):
+            analyze(settings, "--full" in argv)
+    finally: # the profile of a failed or interrupted run is written too
+        finish_profiling()
+
     end_time = datetime.now().replace(microsecond=0)
     delta_time = end_time - start_time
 
@@ -0,0 +1,205 @@
+# snapshot.py
+# Snapshot of the verdict directories (size and mtime of each file, mtime of each directory) diffed run by run:
+# a directory whose mtime did not change since the previous snapshot is not listed again
+
+import json
+import os
+import time
+from collections import Counter
+from os import replace as os_replace
+from pathlib import Path
+
+SNAPSHOT_VERSION = 1
+
+RACY_NS = 2_000_000_000 # a directory modified this close to its scan may have changed after it (coarse mtime), it is listed again
+
+def load_snapshot(file_path:Path) -> dict:
+    """
+    Reads the snapshot of the previous analysis.
+
+    Parameters
+    -----------------------
+    file_path: Path,
+        the snapshot JSON file
+
+    Returns
+    -----------------------
+    The snapshot dictionary ({'version', 'courts', 'directories'}), empty if missing, not valid or of another version.
+    """
+    try:
+        with open(file_path, 'r') as fp:
+            data = json.load(fp)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    return data if isinstance(data, dict) and data.get("version") == SNAPSHOT_VERSION else {}
+
+
+def save_snapshot(file_path:Path, snapshot:dict) -> None:
+    """
+    Writes the snapshot atomically.
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file_path = str(file_path) + '.temp'
+    with open(temp_file_path, 'w') as fp:
+        json.dump(dict(snapshot, version=SNAPSHOT_VERSION), fp, separators=(",", ":"))
+    os_replace(temp_file_path, file_path)
+
+
+def classify(relative_name:str, court_prefixes:list) -> tuple:
+    """
+    Returns the extension (lowercase, without the dot) and the court prefixes of a file name.
+    """
+    name = relative_name.rsplit("/", 1)[-1]
+    extension = Path(name).suffix[1:].lower()
+    return extension, [prefix for prefix in court_prefixes if name.startswith(prefix)]
+
+
+def count_files(relative_names, court_prefixes:list) -> tuple:
+    """
+    Counts files by extension and by court prefix.
+
+    Returns
+    -----------------------
+    (Counter of the extensions, Counter of the court prefixes)
+    """
+    extensions = Counter()
+    courts = Counter()
+    for relative_name in relative_names:
+        extension, prefixes = classify(relative_name, court_prefixes)
+        extensions[extension] += 1
+        courts.update(prefixes)
+    return extensions, courts
+
+
+def scan_tree(top:Path, previous_dirs:dict, full:bool=False) -> tuple:
+    """
+    Lists the files of a directory tree, reusing the entries of the directories unchanged since the previous snapshot.
+
+    Parameters
+    -----------------------
+    top: Path,
+        the verdict directory (e.g. verdicts/2023)
+    previous_dirs: dict,
+        the directories of the previous snapshot of the tree ({relative dir: {'mtime_ns', 'scanned_ns', 'files', 'subdirs'}})
+    full: bool,
+        list every directory again (e.g. to catch files rewritten in place)
+
+    Returns
+    -----------------------
+    (directories of the new snapshot, number of directories listed, number of directories reused)
+    """
+    dirs = {}
+    listed = 0
+    reused = 0
+    pending = [""]
+    while pending:
+        relative_dir = pending.pop()
+        dir_path = top / relative_dir if relative_dir else top
+        try:
+            mtime_ns = os.stat(dir_path).st_mtime_ns
+        except OSError:
+            continue
+        previous = previous_dirs.get(relative_dir)
+        if not full and previous is not None and previous["mtime_ns"] == mtime_ns and previous["scanned_ns"] - mtime_ns > RACY_NS:
+            dirs[relative_dir] = previous
+            reused += 1
+        else:
+            files = {}
+            subdirs = []
+            scanned_ns = time.time_ns()
+            with os.scandir(dir_path) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        subdirs.append(entry.name)
+                    elif entry.is_file() and not entry.name.startswith('._'): # MacOS temporary files excluded
+                        stat = entry.stat()
+                        files[entry.name] = [stat.st_size, stat.st_mtime_ns]
+            dirs[relative_dir] = {"mtime_ns": mtime_ns, "scanned_ns": scanned_ns, "files": files, "subdirs": sorted(subdirs)}
+            listed += 1
+        pending.extend(f"{relative_dir}/{name}" if relative_dir else name for name in dirs[relative_dir]["subdirs"])
+    return dirs, listed, reused
+
+
+def tree_files(dirs:dict) -> dict:
+    """
+    Returns the files of the directories of a snapshot: {relative file name: [size, mtime_ns]}.
+    """
+    return {f"{relative_dir}/{name}" if relative_dir else name: value for relative_dir, entry in dirs.items() for name, value in entry["files"].items()}
+
+
+def diff_trees(previous_dirs:dict, dirs:dict) -> tuple:
+    """
+    Compares two snapshots of a tree, only in the directories listed again (a reused directory is the same object).
+
+    Returns
+    -----------------------
+    (added, removed, changed) lists of relative file names.
+    """
+    changed_dirs = {relative_dir for relative_dir, entry in dirs.items() if previous_dirs.get(relative_dir) is not entry}
+    changed_dirs |= previous_dirs.keys() - dirs.keys()
+    old_files = tree_files({relative_dir: previous_dirs[relative_dir] for relative_dir in changed_dirs if relative_dir in previous_dirs})
+    new_files = tree_files({relative_dir: dirs[relative_dir] for relative_dir in changed_dirs if relative_dir in dirs})
+    added = sorted(new_files.keys() - old_files.keys())
+    removed = sorted(old_files.keys() - new_files.keys())
+    changed = sorted(name for name in new_files.keys() & old_files.keys() if new_files[name] != old_files[name])
+    return added, removed, changed
+
+
+def analyze_directory(top:Path, previous_entry:dict, court_prefixes:list, full:bool=False) -> tuple:
+    """
+    Updates the snapshot of a verdict directory and its counts with the files added, removed and changed since the previous one.
+
+    Parameters
+    -----------------------
+    top: Path,
+        the verdict directory (e.g. verdicts/2023)
+    previous_entry: dict,
+        the snapshot entry of the directory of the previous analysis ({} the first time)
+    court_prefixes: list,
+        court codes, counted as prefixes of the file names
+    full: bool,
+        list every directory again
+
+    Returns
+    -----------------------
+    (new snapshot entry, delta) where the delta has the added, removed and changed files in total, by court and by extension,
+    and the number of directories listed and reused.
+    """
+    previous_dirs = previous_entry.get("dirs", {})
+    dirs, listed, reused = scan_tree(top, previous_dirs, full)
+    added, removed, changed = diff_trees(previous_dirs, dirs)
+
+    counts = previous_entry.get("counts")
+    if counts is None or previous_entry.get("courts") != court_prefixes: # first analysis or other courts: count from the snapshot
+        extensions, courts = count_files(tree_files(dirs), court_prefixes)
+    else:
+        extensions, courts = Counter(counts["extensions"]), Counter(counts["court_counts"])
+        added_extensions, added_courts = count_files(added, court_prefixes)
+        removed_extensions, removed_courts = count_files(removed, court_prefixes)
+        extensions.update(added_extensions)
+        extensions.subtract(removed_extensions)
+        courts.update(added_courts)
+        courts.subtract(removed_courts)
+    total_files = sum(len(entry["files"]) for entry in dirs.values())
+
+    delta = {"added": len(added), "removed": len(removed), "changed": len(changed), "by_court": {}, "by_extension": {}, "dirs_listed": listed, "dirs_reused": reused}
+    for kind, names in (("added", added), ("removed", removed), ("changed", changed)):
+        for name in names:
+            extension, prefixes = classify(name, court_prefixes)
+            delta["by_extension"].setdefault(extension, Counter())[kind] += 1
+            for prefix in prefixes:
+                delta["by_court"].setdefault(prefix, Counter())[kind] += 1
+    delta["by_court"] = {court: dict(values) for court, values in sorted(delta["by_court"].items())}
+    delta["by_extension"] = {extension: dict(values) for extension, values in sorted(delta["by_extension"].items())}
+
+    entry = {
+        "courts": list(court_prefixes),
+        "counts": {
+            "extensions": {key: value for key, value in sorted(extensions.items()) if value > 0},
+            "court_counts": {key: value for key, value in sorted(courts.items()) if value > 0},
+            "total_files": total_files,
+        },
+        "dirs": dirs,
+    }
+    return entry, delta
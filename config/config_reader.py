@@ -1,12 +1,16 @@
 # config_reader.py
 
+import os
 import yaml
+from dataclasses import MISSING, dataclass, fields
 from pathlib import Path
 
+ENV_PREFIX = "IAJ_" # environment overrides, e.g. IAJ_PAGING=30
+
 def read_config_yaml(file_path=None) -> dict:
     """
     Reads a YAML configuration file and returns its contents as a dictionary.
-    
+
     Parameters
     --------------
     file_path: str,
@@ -20,7 +24,8 @@ def read_config_yaml(file_path=None) -> dict:
     if file_path is None:
         # Defaults to config.yml in the same directory as this script
         file_path = Path(__file__).parent / "config.yml"
-    
+    file_path = Path(file_path)
+
     try:
         with file_path.open('r') as file:
             return yaml.safe_load(file)
@@ -29,4 +34,229 @@ def read_config_yaml(file_path=None) -> dict:
         return None
     except yaml.YAMLError as exc:
         print(f"Error in parsing YAML file: {exc}")
-        return None
\ No newline at end of file
+        return None
+
+
+@dataclass(frozen=True)
+class Settings:
+    """
+    Typed view of config.yml: every YAML key maps to the lowercase attribute of the same name.
+    """
+    verdicts_dir: str
+    verdicts_file: str
+    paging: int
+    url_search: str
+    verdicts_stats: str
+    verdicts_stats_file: str
+    courts_dir: str
+    courts_file: str
+    # keys added after the first release have defaults, so older config files keep working
+    verdicts_manifest_file: str = "Y_manifest.json"
+    verdicts_snapshot_file: str = "verdicts_snapshot.json"
+    verdicts_timeseries_file: str = "verdicts_timeseries.csv"
+    plan_file_bytes: int = 50000
+    plan_download_seconds: float = 1.0
+    page_cache_dir: str = ".cache/pages"
+    page_cache_ttl: int = 604800
+    page_cache_max_bytes: int = 268435456
+    session_file: str = ".cache/session.json"
+    session_ttl: int = 1800
+    index_db: str = "verdicts_index.sqlite"
+    integrity_db: str = "verdicts_integrity.sqlite"
+    export_db: str = "verdicts_export.sqlite"
+    export_backend: str = "sqlite"
+    partition_workers: int = 4
+    download_court_weights: str = ""
+    download_year_decay: float = 0.5
+    download_recency_weight: float = 1.0
+    download_rate: float = 0.0
+    profile_dir: str = "profiles"
+    form_court_field: str = "_GaSearch_INSTANCE_2NDgCF3zWBwk_SedeItem"
+    form_date_from_field: str = "_GaSearch_INSTANCE_2NDgCF3zWBwk_DataDaItem"
+    form_date_to_field: str = "_GaSearch_INSTANCE_2NDgCF3zWBwk_DataAItem"
+    form_date_format: str = "%d/%m/%Y"
+
+    def verdicts_file_for(self, year) -> str:
+        """
+        Returns the index file name of a year (the 'Y' placeholder of VERDICTS_FILE is replaced by the year).
+        """
+        return self.verdicts_file.replace("Y", str(year))
+
+    def index_db_path(self) -> Path:
+        """
+        Returns the path of the SQLite verdicts index (INDEX_DB in the verdicts directory).
+        """
+        return Path(self.verdicts_dir) / self.index_db
+
+    def integrity_db_path(self) -> Path:
+        """
+        Returns the path of the SQLite integrity database of the downloaded files (INTEGRITY_DB in the verdicts directory).
+        """
+        return Path(self.verdicts_dir) / self.integrity_db
+
+    def export_db_path(self) -> Path:
+        """
+        Returns the path of the analytical export database (EXPORT_DB in the verdicts directory).
+        """
+        return Path(self.verdicts_dir) / self.export_db
+
+    def manifest_file_for(self, year) -> str:
+        """
+        Returns the crawl manifest file name of a year (the 'Y' placeholder of VERDICTS_MANIFEST_FILE is replaced by the year).
+        """
+        return self.verdicts_manifest_file.replace("Y", str(year))
+
+
+# The paging values accepted by the IAJ search form selectbox
+PAGING_VALUES = (10, 20, 30, 40, 50, 60)
+
+_settings_cache = None
+
+
+def _cast(name:str, raw, to_type, default=MISSING):
+    """
+    Casts a raw configuration value to the type of the Settings field, raising ValueError with the key name on failure.
+    """
+    if raw is None or (isinstance(raw, str) and raw.strip() == ""):
+        if default is not MISSING:
+            return default
+        raise ValueError(f"Configuration key '{name.upper()}' is missing or empty")
+    if to_type in (int, float):
+        type_name = "an integer" if to_type is int else "a number"
+        if isinstance(raw, bool):
+            raise ValueError(f"Configuration key '{name.upper()}' must be {type_name}, got {raw!r}")
+        try:
+            return to_type(raw)
+        except (TypeError, ValueError):
+            raise ValueError(f"Configuration key '{name.upper()}' must be {type_name}, got {raw!r}") from None
+    return str(raw).strip()
+
+
+def validate_settings(settings:Settings) -> Settings:
+    """
+    Checks the values of a Settings object, raising ValueError on the first invalid one.
+
+    Parameters
+    --------------
+    settings: Settings,
+        the settings to be checked
+
+    Returns
+    --------------
+    The same settings object.
+    """
+    if settings.paging not in PAGING_VALUES:
+        raise ValueError(f"Configuration key 'PAGING' must be one of {PAGING_VALUES}, got {settings.paging}")
+    if not settings.url_search.startswith(("http://", "https://")):
+        raise ValueError(f"Configuration key 'URL_SEARCH' must be an http(s) URL, got {settings.url_search!r}")
+    if "Y" not in settings.verdicts_file:
+        raise ValueError(f"Configuration key 'VERDICTS_FILE' must contain the 'Y' year placeholder, got {settings.verdicts_file!r}")
+    if "Y" not in settings.verdicts_manifest_file:
+        raise ValueError(f"Configuration key 'VERDICTS_MANIFEST_FILE' must contain the 'Y' year placeholder, got {settings.verdicts_manifest_file!r}")
+    if settings.plan_file_bytes <= 0 or settings.plan_download_seconds <= 0:
+        raise ValueError("Configuration keys 'PLAN_FILE_BYTES' and 'PLAN_DOWNLOAD_SECONDS' must be positive")
+    if settings.page_cache_ttl < 0 or settings.page_cache_max_bytes <= 0:
+        raise ValueError("Configuration keys 'PAGE_CACHE_TTL' (0 disables the cache) and 'PAGE_CACHE_MAX_BYTES' must not be negative")
+    if settings.session_ttl < 0:
+        raise ValueError(f"Configuration key 'SESSION_TTL' must not be negative (0 disables the saved session), got {settings.session_ttl}")
+    if not 0 < settings.download_year_decay <= 1 or settings.download_recency_weight < 0 or settings.download_rate < 0:
+        raise ValueError("Configuration keys 'DOWNLOAD_YEAR_DECAY' (0 to 1), 'DOWNLOAD_RECENCY_WEIGHT' and 'DOWNLOAD_RATE' (0 = no limit) out of range")
+    if settings.export_backend not in ("sqlite", "duckdb"):
+        raise ValueError(f"Configuration key 'EXPORT_BACKEND' must be 'sqlite' or 'duckdb', got {settings.export_backend!r}")
+    if settings.partition_workers < 1:
+        raise ValueError(f"Configuration key 'PARTITION_WORKERS' must be at least 1, got {settings.partition_workers}")
+    return settings
+
+
+def load_settings(file_path=None, overrides:dict=None, environ:dict=None) -> Settings:
+    """
+    Builds a validated Settings object: YAML values, then environment variables (IAJ_<KEY>), then explicit overrides.
+
+    Parameters
+    --------------
+    file_path: str,
+        optional path to the YAML file (see read_config_yaml)
+    overrides: dict,
+        optional {KEY: value} pairs (e.g. from the command line) applied last
+    environ: dict,
+        optional environment mapping, defaults to os.environ
+
+    Returns
+    --------------
+    The validated Settings object.
+    """
+    raw = read_config_yaml(file_path)
+    if raw is None:
+        raise ValueError(f"Configuration file could not be loaded: {file_path or 'config.yml'}")
+    raw = {str(k).upper(): v for k, v in raw.items()}
+
+    environ = os.environ if environ is None else environ
+    for key, value in environ.items():
+        if key.startswith(ENV_PREFIX):
+            raw[key[len(ENV_PREFIX):].upper()] = value
+
+    for key, value in (overrides or {}).items():
+        raw[str(key).upper()] = value
+
+    known = {f.name.upper() for f in fields(Settings)}
+    unknown = sorted(k for k in (overrides or {}) if str(k).upper() not in known)
+    if unknown:
+        raise ValueError(f"Unknown configuration key(s): {', '.join(unknown)}")
+
+    values = {f.name: _cast(f.name, raw.get(f.name.upper()), f.type, f.default) for f in fields(Settings)}
+    return validate_settings(Settings(**values))
+
+
+def get_settings(file_path=None, overrides:dict=None) -> Settings:
+    """
+    Returns the process-wide Settings, loading and validating them only on the first call.
+    Passing file_path or overrides reloads the settings and replaces the cached ones.
+
+    Parameters
+    --------------
+    file_path: str,
+        optional path to the YAML file
+    overrides: dict,
+        optional {KEY: value} pairs applied after the environment variables
+
+    Returns
+    --------------
+    The cached Settings object.
+    """
+    global _settings_cache
+    if _settings_cache is None or file_path is not None or overrides:
+        _settings_cache = load_settings(file_path, overrides)
+    return _settings_cache
+
+
+def pop_cli_overrides(argv:list) -> tuple:
+    """
+    Extracts the '--config <file>' and '--set KEY=VALUE' options from a command line.
+
+    Parameters
+    --------------
+    argv: list,
+        command line arguments (without the script name)
+
+    Returns
+    --------------
+    remaining arguments, config file path (or None), overrides dictionary
+    """
+    remaining = []
+    config_file = None
+    overrides = {}
+    args = iter(argv)
+    for arg in args:
+        if arg == "--config":
+            config_file = next(args, None)
+        elif arg.startswith("--config="):
+            config_file = arg.split("=", 1)[1]
+        elif arg == "--set" or arg.startswith("--set="):
+            pair = arg.split("=", 1)[1] if arg.startswith("--set=") else next(args, "")
+            if "=" not in pair:
+                raise ValueError(f"Invalid override '{pair}', expected KEY=VALUE")
+            key, value = pair.split("=", 1)
+            overrides[key.strip().upper()] = value
+        else:
+            remaining.append(arg)
+    return remaining, config_file, overrides
@@ -0,0 +1,297 @@
+# integrity.py
+# Integrity of the downloaded verdicts: format (magic bytes), size and hash of each file, checked in parallel processes
+# and remembered in a SQLite database, so a scan only reads the files added or changed since the previous one
+
+import hashlib
+import os
+import sqlite3
+from datetime import datetime
+from pathlib import Path
+
+# first bytes of a valid file, by extension (files with other extensions are only checked to be non-empty)
+MAGIC_BYTES = {
+    "pdf": (b"%PDF-",),
+    "doc": (b"\xd0\xcf\x11\xe0",),
+    "docx": (b"PK\x03\x04",),
+    "odt": (b"PK\x03\x04",),
+    "zip": (b"PK\x03\x04",),
+    "rtf": (b"{\\rtf",),
+    "xml": (b"<",),
+    "p7m": (b"0", b"MI"), # DER or base64 encoded signed file
+}
+
+HTML_EXTENSIONS = ("html", "htm")
+
+# markers of an error page of the website saved in place of a verdict (lowercase, searched in the first bytes)
+ERROR_PAGE_MARKERS = (b"<title>error", b"<title>errore", b"404 not found", b"500 internal server error", b"503 service", b"access denied", b"pagina non trovata")
+
+HEAD_BYTES = 4096
+TAIL_BYTES = 1024
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    anno INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    bytes INTEGER NOT NULL,
+    content_length INTEGER,
+    sha256 TEXT NOT NULL,
+    downloaded_at TEXT NOT NULL,
+    PRIMARY KEY (anno, file_name)
+);
+CREATE TABLE IF NOT EXISTS scans (
+    anno INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    status TEXT NOT NULL,
+    reason TEXT,
+    sha256 TEXT,
+    scanned_at TEXT NOT NULL,
+    PRIMARY KEY (anno, file_name)
+);
+"""
+
+def check_content(file_name:str, head:bytes, tail:bytes, size:int) -> str:
+    """
+    Checks the format of a verdict file from its first and last bytes.
+
+    Parameters
+    -----------------------
+    file_name: str,
+        name of the file (its extension selects the check)
+    head: bytes,
+        first bytes of the file (HEAD_BYTES)
+    tail: bytes,
+        last bytes of the file (TAIL_BYTES)
+    size: int,
+        size of the file
+
+    Returns
+    -----------------------
+    None if the content is valid, else the reason why it is not (e.g. 'empty file').
+    """
+    if size == 0:
+        return "empty file"
+    extension = Path(file_name).suffix[1:].lower()
+    start = head.lstrip(b"\xef\xbb\xbf \t\r\n")
+    if extension in HTML_EXTENSIONS:
+        if not start.startswith(b"<"):
+            return "not an HTML document"
+        lower_head = head.lower()
+        if any(marker in lower_head for marker in ERROR_PAGE_MARKERS):
+            return "error page"
+        if b"</html>" not in tail.lower():
+            return "truncated HTML document"
+        return None
+    if extension in MAGIC_BYTES:
+        if not start.startswith(MAGIC_BYTES[extension]):
+            if start[:1] == b"<" and extension != "xml":
+                return "error page"
+            return f"not a {extension.upper()} file"
+        if extension == "pdf" and b"%%EOF" not in tail:
+            return "truncated PDF file"
+    return None
+
+
+def scan_file(path:str) -> tuple:
+    """
+    Reads a file once, checking its format and computing its SHA-256 (run in the worker processes).
+
+    Parameters
+    -----------------------
+    path: str,
+        the file
+
+    Returns
+    -----------------------
+    (file name, size, mtime_ns, reason or None, sha256); the reason is 'read error: ...' if the file cannot be read.
+    """
+    name = os.path.basename(path)
+    digest = hashlib.sha256()
+    try:
+        stat = os.stat(path)
+        with open(path, 'rb') as fp:
+            head = fp.read(HEAD_BYTES)
+            digest.update(head)
+            tail = head[-TAIL_BYTES:]
+            for block in iter(lambda: fp.read(1 << 20), b""):
+                digest.update(block)
+                tail = (tail + block)[-TAIL_BYTES:]
+    except OSError as e:
+        return name, 0, 0, f"read error: {e.strerror}", None
+    return name, stat.st_size, stat.st_mtime_ns, check_content(name, head, tail, stat.st_size), digest.hexdigest()
+
+
+class IntegrityStore:
+    """
+    SQLite database of the download records (bytes, Content-Length and SHA-256 of each file as downloaded)
+    and of the last scan result of each file (size and mtime, to skip the unchanged files).
+    """
+
+    def __init__(self, db_path:str):
+        """
+        Parameters
+        -----------------------
+        db_path: str,
+            SQLite database file (created if missing)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def record_download(self, year:int, file_name:str, content:bytes, content_length:int=None) -> None:
+        """
+        Records a downloaded file: its bytes, the Content-Length announced by the server and its SHA-256.
+        """
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO downloads (anno, file_name, bytes, content_length, sha256, downloaded_at) VALUES (?, ?, ?, ?, ?, ?)",
+                              (year, file_name, len(content), content_length, hashlib.sha256(content).hexdigest(), datetime.now().replace(microsecond=0).isoformat()))
+
+    def downloads(self, year:int) -> dict:
+        """
+        Returns the download records of a year: {file name: (bytes, content_length, sha256)}.
+        """
+        rows = self.conn.execute("SELECT file_name, bytes, content_length, sha256 FROM downloads WHERE anno = ?", (year,))
+        return {row["file_name"]: (row["bytes"], row["content_length"], row["sha256"]) for row in rows}
+
+    def scans(self, year:int) -> dict:
+        """
+        Returns the last scan results of a year: {file name: sqlite3.Row}.
+        """
+        return {row["file_name"]: row for row in self.conn.execute("SELECT * FROM scans WHERE anno = ?", (year,))}
+
+    def save_scans(self, year:int, results:list) -> None:
+        """
+        Saves a batch of scan results: list of (file name, size, mtime_ns, status, reason, sha256).
+        """
+        scanned_at = datetime.now().replace(microsecond=0).isoformat()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO scans (anno, file_name, size, mtime_ns, status, reason, sha256, scanned_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                                  [(year, *result, scanned_at) for result in results])
+
+    def forget(self, year:int, file_names:list) -> None:
+        """
+        Deletes the scan and download records of files no longer on disk.
+        """
+        with self.conn:
+            for table in ("scans", "downloads"):
+                self.conn.executemany(f"DELETE FROM {table} WHERE anno = ? AND file_name = ?", [(year, name) for name in file_names])
+
+    def corrupt_counts(self) -> dict:
+        """
+        Returns the number of corrupt files found by the last scans, by year.
+        """
+        return {row["anno"]: row["n"] for row in self.conn.execute("SELECT anno, COUNT(*) AS n FROM scans WHERE status = 'corrupt' GROUP BY anno")}
+
+
+def compare_with_download(result:tuple, record:tuple) -> str:
+    """
+    Compares a scanned file with its download record (size against the bytes and the Content-Length, then the hash).
+
+    Parameters
+    -----------------------
+    result: tuple,
+        scan_file result (name, size, mtime_ns, reason, sha256)
+    record: tuple,
+        download record (bytes, content_length, sha256), None if the file was downloaded before the records
+
+    Returns
+    -----------------------
+    None if they match, else the reason.
+    """
+    if record is None:
+        return None
+    _, size, _, _, sha256 = result
+    recorded_bytes, content_length, recorded_sha256 = record
+    if content_length is not None and recorded_bytes != content_length:
+        return f"truncated download ({recorded_bytes} of {content_length} bytes)"
+    if size != recorded_bytes:
+        return f"size changed ({size} bytes, {recorded_bytes} downloaded)"
+    if sha256 != recorded_sha256:
+        return "hash changed"
+    return None
+
+
+def scan_year(store:IntegrityStore, year_dir:Path, year:int, index_names:set, workers:int=None, full:bool=False, batch_size:int=1000) -> dict:
+    """
+    Scans the downloaded files of a year: the new or changed files (all of them with full) are checked in parallel
+    processes, the others keep their previous result. The results are saved batch by batch, so an interrupted scan
+    resumes from the files not yet saved.
+
+    Parameters
+    -----------------------
+    store: IntegrityStore,
+        the integrity database
+    year_dir: Path,
+        directory of the downloaded files of the year
+    year: int,
+        the year
+    index_names: set,
+        file names listed in the year index
+    workers: int,
+        worker processes (default: CPU count)
+    full: bool,
+        check again the files already checked and unchanged
+    batch_size: int,
+        results saved per transaction
+
+    Returns
+    -----------------------
+    Dictionary with the counts (files, scanned, reused) and the lists of missing, orphaned and corrupt ({file: reason}) files.
+    """
+    from concurrent.futures import ProcessPoolExecutor
+
+    on_disk = {}
+    if year_dir.is_dir():
+        with os.scandir(year_dir) as entries:
+            for entry in entries:
+                if entry.name.startswith('._') or entry.name.endswith('.temp') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                on_disk[entry.name] = (stat.st_size, stat.st_mtime_ns)
+
+    previous = store.scans(year)
+    store.forget(year, [name for name in previous if name not in on_disk])
+    to_scan = {name for name, (size, mtime_ns) in on_disk.items()
+               if full or name not in previous or previous[name]["size"] != size or previous[name]["mtime_ns"] != mtime_ns}
+    reused = len(on_disk) - len(to_scan)
+
+    downloads = store.downloads(year)
+    corrupt = {name: row["reason"] for name, row in previous.items() if name in on_disk and name not in to_scan and row["status"] == "corrupt"}
+    batch = []
+    if to_scan:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            paths = [str(year_dir / name) for name in sorted(to_scan)]
+            for result in executor.map(scan_file, paths, chunksize=max(1, min(256, len(paths) // (4 * (workers or os.cpu_count() or 1))))):
+                name, size, mtime_ns, reason, sha256 = result
+                reason = reason or compare_with_download(result, downloads.get(name))
+                if reason:
+                    corrupt[name] = reason
+                batch.append((name, size, mtime_ns, "corrupt" if reason else "ok", reason, sha256))
+                if len(batch) >= batch_size:
+                    store.save_scans(year, batch)
+                    batch = []
+    if batch:
+        store.save_scans(year, batch)
+
+    return {
+        "files": len(on_disk),
+        "scanned": len(to_scan),
+        "reused": reused,
+        "missing": sorted(index_names - on_disk.keys()),
+        "orphaned": sorted(on_disk.keys() - index_names),
+        "corrupt": dict(sorted(corrupt.items())),
+    }
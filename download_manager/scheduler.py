@@ -0,0 +1,198 @@
+# scheduler.py
+# Priority order of the download queue: weights by court, year and recency, shared across courts in proportion
+# to court weight times file score (stride scheduling) and jobs with a deadline served first (earliest deadline first)
+
+import heapq
+from datetime import datetime
+
+def parse_court_weights(spec:str) -> dict:
+    """
+    Parses the court weights setting, e.g. 'cds=3,tar_rm=2' (courts not listed have weight 1).
+
+    Parameters
+    -----------------------
+    spec: str,
+        comma separated court=weight pairs (empty for no weights)
+
+    Returns
+    -----------------------
+    Dictionary {court code: weight}.
+    """
+    weights = {}
+    for pair in filter(None, (item.strip() for item in (spec or "").split(","))):
+        court, _, weight = pair.partition("=")
+        try:
+            weights[court.strip().lower()] = float(weight)
+        except ValueError:
+            raise ValueError(f"Invalid court weight '{pair}', expected COURT=WEIGHT") from None
+        if weights[court.strip().lower()] <= 0:
+            raise ValueError(f"Invalid court weight '{pair}', the weight must be positive")
+    return weights
+
+
+def parse_job(spec:str) -> dict:
+    """
+    Parses a deadline job, e.g. 'cds:2023@2026-10-20T18:00' (files of a court, optionally of a year, due by the deadline).
+
+    Parameters
+    -----------------------
+    spec: str,
+        COURT[:YEAR]@DEADLINE, the deadline in ISO format; the court can be '*' (all the courts)
+
+    Returns
+    -----------------------
+    Dictionary with court (None for all), year (None for all) and deadline (datetime).
+    """
+    target, _, deadline = spec.partition("@")
+    court, _, year = target.partition(":")
+    try:
+        return {
+            "spec": spec,
+            "court": None if court in ("", "*") else court.strip().lower(),
+            "year": int(year) if year else None,
+            "deadline": datetime.fromisoformat(deadline.strip()),
+        }
+    except ValueError:
+        raise ValueError(f"Invalid job '{spec}', expected COURT[:YEAR]@YYYY-MM-DDTHH:MM") from None
+
+
+def score_rows(queue_df, year_decay:float, recency_weight:float):
+    """
+    Scores the files to be downloaded: the most recent year scores 1, each year before it is multiplied by year_decay,
+    and within a court and year the verdicts with the highest numbers (the latest ones) get up to recency_weight more.
+
+    Parameters
+    -----------------------
+    queue_df: pd.DataFrame,
+        files to be downloaded with the columns anno, tribunale_codice and sentenza_numero
+    year_decay: float,
+        multiplier per year of age (1 = no preference for recent years)
+    recency_weight: float,
+        extra score of the latest verdict of a court and year (0 = index order)
+
+    Returns
+    -----------------------
+    pd.Series of the scores.
+    """
+    import pandas as pd
+
+    age = queue_df["anno"].max() - queue_df["anno"]
+    numbers = pd.to_numeric(queue_df["sentenza_numero"], errors="coerce")
+    max_numbers = numbers.groupby([queue_df["tribunale_codice"], queue_df["anno"]]).transform("max")
+    recency = (numbers / max_numbers).where(max_numbers > 0).fillna(0.0)
+    return (year_decay ** age) * (1.0 + recency_weight * recency)
+
+
+def job_deadlines(queue_df, jobs:list):
+    """
+    Returns the earliest deadline of the jobs matching each file (NaT for the files of no job).
+    """
+    import pandas as pd
+
+    deadlines = pd.Series(pd.NaT, index=queue_df.index, dtype="datetime64[ns]")
+    for job in jobs:
+        mask = pd.Series(True, index=queue_df.index)
+        if job["court"] is not None:
+            mask &= queue_df["tribunale_codice"].str.lower() == job["court"]
+        if job["year"] is not None:
+            mask &= queue_df["anno"] == job["year"]
+        deadline = pd.Timestamp(job["deadline"])
+        deadlines = deadlines.mask(mask & (deadlines.isna() | (deadlines > deadline)), deadline)
+    return deadlines
+
+
+def schedule_downloads(queue_df, court_weights:dict=None, year_decay:float=0.5, recency_weight:float=1.0, jobs:list=None):
+    """
+    Orders the download queue: first the files of the deadline jobs (earliest deadline first, then by score), then
+    the others shared across courts by stride scheduling, each court by score. The stride of a court is scaled by the
+    score of its next file, so a court's share is its weight times the score of its files: a court left with files
+    of old years gets a smaller share of the queue (and of a --limit budget) than a court with files of the current year.
+
+    Parameters
+    -----------------------
+    queue_df: pd.DataFrame,
+        files to be downloaded with the columns anno, tribunale_codice and sentenza_numero
+    court_weights: dict,
+        {court code: weight}, see parse_court_weights
+    year_decay: float,
+        see score_rows
+    recency_weight: float,
+        see score_rows
+    jobs: list,
+        deadline jobs, see parse_job
+
+    Returns
+    -----------------------
+    The queue DataFrame in download order, with the score and deadline columns.
+    """
+    import pandas as pd
+
+    if len(queue_df) == 0:
+        return queue_df.assign(score=pd.Series(dtype=float), deadline=pd.Series(dtype="datetime64[ns]"))
+    court_weights = court_weights or {}
+    queue_df = queue_df.assign(
+        tribunale_codice=queue_df["tribunale_codice"].fillna("").astype(str),
+        score=score_rows(queue_df, year_decay, recency_weight),
+        deadline=job_deadlines(queue_df, jobs or []),
+    )
+
+    due = queue_df[queue_df["deadline"].notna()].sort_values(["deadline", "score"], ascending=[True, False], kind="stable")
+    rest = queue_df[queue_df["deadline"].isna()].sort_values("score", ascending=False, kind="stable")
+
+    # stride scheduling: each file of a court takes 1/(weight * score) of its pass, the court whose next file
+    # finishes first is served next (scores are positive, DOWNLOAD_YEAR_DECAY > 0)
+    scores = rest["score"].to_numpy()
+    queues = {court: list(positions) for court, positions in rest.groupby("tribunale_codice", sort=True).indices.items()}
+    strides = {court: 1.0 / court_weights.get(court.lower(), 1.0) for court in queues}
+    heap = [(strides[court] / scores[positions[0]], court) for court, positions in queues.items()]
+    heapq.heapify(heap)
+    next_position = dict.fromkeys(queues, 0)
+    order = []
+    while heap:
+        stride_pass, court = heapq.heappop(heap)
+        order.append(queues[court][next_position[court]])
+        next_position[court] += 1
+        if next_position[court] < len(queues[court]):
+            heapq.heappush(heap, (stride_pass + strides[court] / scores[queues[court][next_position[court]]], court))
+
+    return pd.concat([due, rest.iloc[order]])
+
+
+def deadline_report(scheduled_df, jobs:list, rate:float, start:datetime=None) -> list:
+    """
+    Estimates when the files of each job are downloaded at the rate budget.
+
+    Parameters
+    -----------------------
+    scheduled_df: pd.DataFrame,
+        the queue in download order (see schedule_downloads)
+    jobs: list,
+        deadline jobs, see parse_job
+    rate: float,
+        files downloaded per second (0 = no estimate)
+    start: datetime,
+        start of the downloads (default: now)
+
+    Returns
+    -----------------------
+    List of (job, files, queue position of its last file or None, estimated finish or None, True if the deadline is met or cannot be estimated).
+    """
+    from datetime import timedelta
+
+    start = start or datetime.now()
+    report = []
+    positions = scheduled_df.reset_index(drop=True)
+    for job in jobs:
+        mask = positions["deadline"].notna()
+        if job["court"] is not None:
+            mask &= positions["tribunale_codice"].str.lower() == job["court"]
+        if job["year"] is not None:
+            mask &= positions["anno"] == job["year"]
+        files = int(mask.sum())
+        last = int(positions.index[mask].max()) if files else None
+        if files == 0 or rate <= 0:
+            report.append((job, files, last, None, True))
+            continue
+        finish = start + timedelta(seconds=(last + 1) / rate)
+        report.append((job, files, last, finish, finish <= job["deadline"]))
+    return report
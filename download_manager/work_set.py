@@ -0,0 +1,53 @@
+# work_set.py
+# Bulk computation of the files to be downloaded (one directory listing, vectorized anti-join on the index)
+
+import os
+from pathlib import Path
+
+def list_directory_files(directory_path:str) -> set:
+    """
+    Lists the names of the files in a directory with a single scan (MacOS '._' files excluded).
+
+    Parameters
+    -----------------------
+    directory_path: str,
+        the directory (e.g. verdicts/2023)
+
+    Returns
+    -----------------------
+    Set of file names, empty if the directory does not exist.
+    """
+    if not Path(directory_path).is_dir():
+        return set()
+    with os.scandir(directory_path) as entries:
+        return {entry.name for entry in entries if not entry.name.startswith('._') and entry.is_file()}
+
+
+def compute_work_set(input_df, present_files:set, file_column:str="sentenza_file") -> tuple:
+    """
+    Splits the rows of a verdicts index in duplicates, files already present and files to be downloaded,
+    with vectorized pandas operations (no per-row filesystem check).
+
+    Parameters
+    -----------------------
+    input_df: pd.DataFrame,
+        the verdicts index (at least the file_column)
+    present_files: set,
+        names of the files already in the download directory (see list_directory_files)
+    file_column: str,
+        column with the file names
+
+    Returns
+    -----------------------
+    DataFrame of the rows to be downloaded, dictionary of the counts (rows, duplicates, already_present, to_download).
+    """
+    duplicated_mask = input_df.duplicated(subset=[file_column], keep="first") # the same file listed more than once
+    present_mask = input_df[file_column].isin(present_files) & ~duplicated_mask
+    download_mask = ~duplicated_mask & ~present_mask
+    counts = {
+        "rows": int(len(input_df)),
+        "duplicates": int(duplicated_mask.sum()),
+        "already_present": int(present_mask.sum()),
+        "to_download": int(download_mask.sum()),
+    }
+    return input_df.loc[download_mask], counts
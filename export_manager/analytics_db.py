@@ -0,0 +1,322 @@
+# analytics_db.py
+# Export of the verdicts indexes, the downloaded files metadata and the analyzer time series to an embedded
+# analytical database (SQLite, or DuckDB if installed), loaded in bulk and incrementally: a source (year index file,
+# year directory, time-series file) is reloaded only if it changed since the previous export
+# duckdb and pandas are imported only by the DuckDB backend
+
+import os
+import sqlite3
+from pathlib import Path
+
+from index_manager.verdict_index import INDEX_COLUMNS, index_files, parse_index_row
+
+EXPORT_BACKENDS = ("sqlite", "duckdb")
+
+TIMESERIES_COLUMNS = ["analyzed_at", "directory", "total_files", "added", "removed", "changed", "corrupt_files"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    anno INTEGER NOT NULL,
+    pagina INTEGER,
+    codice_ecli TEXT,
+    provvedimento_titolo TEXT,
+    provvedimento_tipo TEXT,
+    sentenza_numero TEXT,
+    tribunale_codice TEXT,
+    tribunale_citta TEXT,
+    tribunale_sezione TEXT,
+    ricorso_numero TEXT,
+    sentenza_url TEXT,
+    sentenza_file TEXT NOT NULL,
+    PRIMARY KEY (anno, sentenza_file)
+);
+CREATE TABLE IF NOT EXISTS files (
+    anno INTEGER NOT NULL,
+    file_name TEXT NOT NULL,
+    extension TEXT,
+    size BIGINT NOT NULL,
+    mtime_ns BIGINT NOT NULL,
+    PRIMARY KEY (anno, file_name)
+);
+CREATE TABLE IF NOT EXISTS analysis_stats (
+    seq INTEGER NOT NULL,
+    analyzed_at TEXT NOT NULL,
+    directory TEXT NOT NULL,
+    total_files INTEGER,
+    added INTEGER,
+    removed INTEGER,
+    changed INTEGER,
+    corrupt_files INTEGER,
+    PRIMARY KEY (analyzed_at, directory, seq)
+);
+CREATE TABLE IF NOT EXISTS export_sources (
+    source TEXT PRIMARY KEY,
+    signature TEXT NOT NULL,
+    rows_loaded BIGINT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS coverage_summary (
+    anno INTEGER NOT NULL,
+    tribunale_codice TEXT,
+    verdicts BIGINT NOT NULL,
+    downloaded BIGINT NOT NULL,
+    bytes BIGINT NOT NULL,
+    coverage_pct DOUBLE
+);
+CREATE VIEW IF NOT EXISTS coverage AS
+SELECT v.anno, v.tribunale_codice, COUNT(*) AS verdicts, COUNT(f.file_name) AS downloaded, COALESCE(SUM(f.size), 0) AS bytes,
+       ROUND(100.0 * COUNT(f.file_name) / COUNT(*), 2) AS coverage_pct
+FROM verdicts v LEFT JOIN files f ON f.anno = v.anno AND f.file_name = v.sentenza_file
+GROUP BY v.anno, v.tribunale_codice;
+"""
+
+VERDICT_COLUMNS = ["anno"] + INDEX_COLUMNS
+FILE_COLUMNS = ["anno", "file_name", "extension", "size", "mtime_ns"]
+STATS_COLUMNS = ["seq"] + TIMESERIES_COLUMNS # seq: line of the time series, two analyses of a directory can share the second
+
+# primary key of each table (a batch keeps the last row of a key, as INSERT OR REPLACE does row by row)
+TABLE_KEYS = {"verdicts": ["anno", "sentenza_file"], "files": ["anno", "file_name"], "analysis_stats": ["analyzed_at", "directory", "seq"]}
+
+
+class AnalyticsDB:
+    """
+    Embedded analytical database of the exported data. The tables are verdicts (index rows), files (downloaded files)
+    and analysis_stats (analyzer time series), joined by the coverage view (verdicts and downloaded files by court and year).
+    """
+
+    def __init__(self, db_path:str, backend:str="sqlite"):
+        """
+        Parameters
+        -----------------------
+        db_path: str,
+            database file (created if missing)
+        backend: str,
+            'sqlite' or 'duckdb' (requires the duckdb package)
+        """
+        if backend not in EXPORT_BACKENDS:
+            raise ValueError(f"Unknown export backend '{backend}', expected one of {EXPORT_BACKENDS}")
+        self.backend = backend
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        if backend == "duckdb":
+            try:
+                import duckdb
+            except ImportError:
+                raise ValueError("Export backend 'duckdb' requires the duckdb package (pip install duckdb)") from None
+            self.conn = duckdb.connect(str(self.db_path))
+        else:
+            self.conn = sqlite3.connect(str(self.db_path), isolation_level=None) # transactions opened by replace_source
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+        self._create_schema()
+        stats_columns = [column[0] for column in self.conn.execute("SELECT * FROM analysis_stats LIMIT 0").description]
+        if "seq" not in stats_columns: # older schema, keyed without seq: dropped and reloaded at the next export
+            self.conn.execute("DROP TABLE analysis_stats")
+            self.conn.execute("DELETE FROM export_sources WHERE source = 'analysis_stats'")
+            self._create_schema()
+
+    def _create_schema(self) -> None:
+        if self.backend == "duckdb":
+            for statement in filter(str.strip, SCHEMA.split(";")):
+                self.conn.execute(statement)
+        else:
+            self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def _signature(self, source:str) -> str:
+        row = self.conn.execute("SELECT signature FROM export_sources WHERE source = ?", [source]).fetchone()
+        return row[0] if row else None
+
+    def _insert(self, table:str, columns:list, rows:list) -> None:
+        """
+        Inserts a batch of rows: executemany on SQLite, a DataFrame scan on DuckDB (bulk, like a COPY).
+        """
+        if not rows:
+            return
+        if self.backend == "duckdb":
+            import pandas as pd
+            batch_df = pd.DataFrame(rows, columns=columns).drop_duplicates(subset=TABLE_KEYS[table], keep="last")
+            self.conn.register("batch_df", batch_df)
+            self.conn.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) SELECT {', '.join(columns)} FROM batch_df")
+            self.conn.unregister("batch_df")
+        else:
+            self.conn.executemany(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})", rows)
+
+    def replace_source(self, source:str, signature:str, table:str, columns:list, delete_where:tuple, batches) -> int:
+        """
+        Reloads the rows of a source in one transaction if its signature changed (idempotent: the same source
+        loaded twice gives the same rows).
+
+        Parameters
+        -----------------------
+        source: str,
+            name of the source (e.g. 'index:2023')
+        signature: str,
+            signature of the source content (e.g. size and mtime of the file)
+        table: str,
+            table of the rows
+        columns: list,
+            columns of the rows
+        delete_where: tuple,
+            (SQL condition, parameters) selecting the rows of the source to be deleted before the load
+        batches:
+            iterable of lists of rows
+
+        Returns
+        -----------------------
+        The rows of the source stored in the table (rows sharing a primary key count once), None if the source is unchanged.
+        """
+        if self._signature(source) == signature:
+            return None
+        self.conn.execute("BEGIN TRANSACTION")
+        try:
+            self.conn.execute(f"DELETE FROM {table} WHERE {delete_where[0]}", list(delete_where[1]))
+            for batch in batches:
+                self._insert(table, columns, batch)
+            loaded = self.conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {delete_where[0]}", list(delete_where[1])).fetchone()[0]
+            self.conn.execute("DELETE FROM export_sources WHERE source = ?", [source])
+            self.conn.execute("INSERT INTO export_sources (source, signature, rows_loaded) VALUES (?, ?, ?)", [source, signature, loaded])
+            self.conn.execute("COMMIT")
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        return loaded
+
+    def refresh_coverage(self, years:list) -> None:
+        """
+        Recomputes the rows of coverage_summary (the coverage view materialized) of the years whose index or files changed.
+        """
+        for year in years:
+            self.conn.execute("BEGIN TRANSACTION")
+            try:
+                self.conn.execute("DELETE FROM coverage_summary WHERE anno = ?", [year])
+                self.conn.execute("INSERT INTO coverage_summary SELECT * FROM coverage WHERE anno = ?", [year])
+                self.conn.execute("COMMIT")
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def query(self, sql:str, parameters:list=None) -> tuple:
+        """
+        Runs a query and returns (column names, rows).
+        """
+        cursor = self.conn.execute(sql, parameters or [])
+        return [column[0] for column in cursor.description], cursor.fetchall()
+
+
+def file_signature(path:Path) -> str:
+    """
+    Returns the signature of a file (size and mtime), None if it does not exist.
+    """
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def index_batches(year:int, path:Path, batch_size:int):
+    """
+    Yields the rows of a year index file in batches (header and malformed lines skipped).
+    """
+    batch = []
+    with open(path, 'r', newline='') as fp:
+        for line in fp:
+            row = parse_index_row(line.rstrip("\r\n"), year)
+            if row is None:
+                continue
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def file_batches(year:int, year_dir:Path, batch_size:int):
+    """
+    Yields the metadata of the downloaded files of a year directory in batches (one directory listing).
+    """
+    batch = []
+    with os.scandir(year_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('._') or entry.name.endswith('.temp') or not entry.is_file():
+                continue
+            stat = entry.stat()
+            batch.append([year, entry.name, Path(entry.name).suffix[1:].lower(), stat.st_size, stat.st_mtime_ns])
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def timeseries_batches(path:Path):
+    """
+    Yields the rows of the analyzer time-series CSV, numbered by line (one batch, the file is small).
+    """
+    rows = []
+    with open(path, 'r', newline='') as fp:
+        for number, line in enumerate(fp):
+            values = line.rstrip("\r\n").split(";")
+            if number == 0 or len(values) != len(TIMESERIES_COLUMNS):
+                continue
+            rows.append([number] + values[:2] + [int(value) if value.isdigit() else None for value in values[2:]])
+    yield rows
+
+
+def export_all(db:AnalyticsDB, verdict_dir:str, verdicts_file:str, timeseries_path:Path, full:bool=False, batch_size:int=50000) -> dict:
+    """
+    Exports the year index files, the year directories of the downloaded files and the analyzer time series,
+    reloading only the sources changed since the previous export (all of them with full); the coverage summary
+    of the changed years is then recomputed.
+
+    Parameters
+    -----------------------
+    db: AnalyticsDB,
+        the analytical database
+    verdict_dir: str,
+        directory of the index files and of the year directories
+    verdicts_file: str,
+        VERDICTS_FILE setting (e.g. Y_verdicts.csv)
+    timeseries_path: Path,
+        the analyzer time-series CSV
+    full: bool,
+        reload every source
+    batch_size: int,
+        rows per insert batch
+
+    Returns
+    -----------------------
+    Dictionary {source: rows stored, or None if unchanged}.
+    """
+    if full:
+        db.conn.execute("DELETE FROM export_sources")
+        db.conn.execute("DELETE FROM coverage_summary")
+    loaded = {}
+    years = [year for year, _ in index_files(verdict_dir, verdicts_file)]
+    stale_years = [row[0] for row in db.conn.execute("SELECT DISTINCT anno FROM verdicts").fetchall() if row[0] not in years]
+    for year in stale_years: # index file removed since the previous export
+        for table in ("verdicts", "files", "coverage_summary"):
+            db.conn.execute(f"DELETE FROM {table} WHERE anno = ?", [year])
+        db.conn.execute("DELETE FROM export_sources WHERE source IN (?, ?)", [f"index:{year}", f"files:{year}"])
+    for year, path in index_files(verdict_dir, verdicts_file):
+        loaded[f"index:{year}"] = db.replace_source(f"index:{year}", file_signature(path), "verdicts", VERDICT_COLUMNS,
+                                                    ("anno = ?", [year]), index_batches(year, path, batch_size))
+        year_dir = Path(verdict_dir) / str(year)
+        if year_dir.is_dir(): # the directory mtime changes when a file is added, replaced or removed
+            loaded[f"files:{year}"] = db.replace_source(f"files:{year}", str(year_dir.stat().st_mtime_ns), "files", FILE_COLUMNS,
+                                                        ("anno = ?", [year]), file_batches(year, year_dir, batch_size))
+    db.refresh_coverage([year for year in years if loaded.get(f"index:{year}") is not None or loaded.get(f"files:{year}") is not None])
+    signature = file_signature(Path(timeseries_path))
+    if signature is not None:
+        loaded["analysis_stats"] = db.replace_source("analysis_stats", signature, "analysis_stats", STATS_COLUMNS,
+                                                     ("1 = 1", []), timeseries_batches(Path(timeseries_path)))
+    return loaded
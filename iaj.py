@@ -0,0 +1,463 @@
+# iaj.py
+# Command line interface: scrape, download, analyze, pipeline, plan, verify, scan, export and index subcommands
+# The numbered scripts are imported only by the subcommands that need them, so 'plan' and '--help' start fast
+
+### IMPORT ###
+import argparse
+import importlib
+import os
+import sys
+from datetime import datetime, timedelta
+from pathlib import Path
+
+### LOCAL IMPORT ###
+from config.config_reader import get_settings
+from utility_manager.manifest import read_manifest
+from utility_manager.profiler import PROFILE_MODES, finish_profiling, span, start_profiling
+from utility_manager.utilities import script_info
+
+### GLOBALS ###
+script_path, script_name = script_info(__file__)
+
+### FUNCTIONS ###
+
+def load_script(module_name:str):
+    """
+    Import one of the numbered scripts (e.g. '01_scraper') as a module.
+
+    Args:
+        module_name (str): The script name without the '.py' extension.
+
+    Returns:
+        module: The imported script.
+    """
+    return importlib.import_module(module_name)
+
+def read_index_files(index_path:Path) -> set:
+    """
+    Read the 'sentenza_file' values (last column) of a verdicts index CSV without loading pandas.
+
+    Args:
+        index_path (Path): The verdicts index CSV file.
+
+    Returns:
+        set: The file names listed in the index (header rows excluded), empty if the index does not exist.
+    """
+    files = set()
+    if not index_path.exists():
+        return files
+    with open(index_path, 'r', newline='') as fp:
+        for line in fp:
+            file_name = line.rstrip("\r\n").rsplit(";", 1)[-1]
+            if file_name and file_name != "sentenza_file" and file_name != "n.d.":
+                files.add(file_name)
+    return files
+
+def format_bytes(size:float) -> str:
+    """
+    Format a number of bytes with a binary unit (e.g. 1.5 MiB).
+
+    Args:
+        size (float): The number of bytes.
+
+    Returns:
+        str: The formatted size.
+    """
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if size < 1024:
+            return f"{size:.1f} {unit}"
+        size /= 1024
+    return f"{size:.1f} TiB"
+
+def plan(input_search:str, year_search:int, settings, workers:int, offline:bool) -> dict:
+    """
+    Estimate the work of a run before crawling: pages to be parsed, new downloads, bytes and time.
+    Only page 0 of the query is submitted (skipped with offline, using the manifest of the last crawl instead;
+    the manifest is used too if the website cannot be reached). The new results are counted against the last
+    crawl of the same query in the manifest (all the results if the query was never crawled), since the year
+    index mixes the rows of every query of the year.
+
+    Args:
+        input_search (str): The search query or keywords (None to plan only the downloads).
+        year_search (int): The year of the judgment.
+        settings (config.config_reader.Settings): The validated settings.
+        workers (int): The number of parallel download workers to size the estimate for.
+        offline (bool): True to avoid any request to the IAJ website.
+
+    Returns:
+        dict: The plan figures.
+    """
+    verdict_dir = settings.verdicts_dir
+    index_files = read_index_files(Path(verdict_dir) / settings.verdicts_file_for(year_search))
+
+    year_dir = Path(verdict_dir) / str(year_search)
+    present_sizes = {}
+    if year_dir.is_dir():
+        with os.scandir(year_dir) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.startswith('._'):
+                    present_sizes[entry.name] = entry.stat().st_size
+    missing_files = index_files - present_sizes.keys()
+    avg_file_bytes = sum(present_sizes.values()) / len(present_sizes) if present_sizes else settings.plan_file_bytes
+
+    res_num = None
+    total_pages = None
+    page_seconds = None
+    source = "none"
+    error = None
+    entry = {}
+    if input_search is not None:
+        entry = read_manifest(verdict_dir, settings.manifest_file_for(year_search)).get(input_search) or {}
+        if not offline:
+            import mechanicalsoup
+            import requests
+            from scraper_manager.crawler import fetch_result_summary, open_search_page
+            try:
+                browser = open_search_page(settings.url_search)
+                res_num, total_pages, page_seconds = fetch_result_summary(input_search, year_search, settings.paging, browser)
+                source = "website (page 0)"
+            except (mechanicalsoup.LinkNotFoundError, requests.RequestException) as e:
+                error = f"{type(e).__name__}: {e}"
+                print(f"WARNING! Cannot read the results summary from '{settings.url_search}' ({error}), using the manifest")
+        if res_num is None and entry:
+            res_num, total_pages = entry.get("res_num"), entry.get("total_pages")
+            source = f"manifest ({entry.get('updated_at')})"
+
+    pages = total_pages + 1 if total_pages is not None else 0 # pages goes from 0 to total_pages
+    # verdicts already collected by the last crawl of the query: distinct rows if verified, else its results number
+    crawled = entry.get("rows") if entry.get("rows") is not None else entry.get("res_num") or 0
+    new_results = max(res_num - crawled, 0) if res_num is not None else 0
+    downloads = len(missing_files) + new_results
+    download_seconds = downloads * settings.plan_download_seconds / max(workers, 1)
+    crawl_seconds = pages * page_seconds if page_seconds is not None else None
+
+    return {
+        "query": input_search,
+        "year": year_search,
+        "summary_source": source,
+        "summary_error": error,
+        "res_num": res_num,
+        "pages": pages,
+        "indexed_files": len(index_files),
+        "present_files": len(present_sizes),
+        "new_results": new_results,
+        "missing_files": len(missing_files),
+        "downloads": downloads,
+        "estimated_bytes": downloads * avg_file_bytes,
+        "crawl_seconds": crawl_seconds,
+        "download_seconds": download_seconds,
+        "workers": workers,
+    }
+
+def print_plan(result:dict) -> None:
+    """
+    Print the figures computed by plan().
+
+    Args:
+        result (dict): The plan figures.
+
+    Returns:
+        None
+    """
+    print(">> Plan")
+    print("Query:", result["query"])
+    print("Year:", result["year"])
+    print("Results summary from:", result["summary_source"])
+    if result["summary_error"] is not None:
+        print("Website error:", result["summary_error"])
+    print("Results found:", result["res_num"] if result["res_num"] is not None else "n.d.")
+    print("Pages to be parsed:", result["pages"])
+    print("Files in the index:", result["indexed_files"])
+    print("Files already downloaded:", result["present_files"])
+    print("Results not yet crawled:", result["new_results"])
+    print("Indexed files not yet downloaded:", result["missing_files"])
+    print("New downloads:", result["downloads"])
+    print("Estimated download size:", format_bytes(result["estimated_bytes"]))
+    if result["crawl_seconds"] is not None:
+        print("Estimated crawl time:", timedelta(seconds=round(result["crawl_seconds"])))
+    print(f"Estimated download time ({result['workers']} workers):", timedelta(seconds=round(result["download_seconds"])))
+    print()
+
+def index_command(args, settings) -> None:
+    """
+    Refresh the SQLite verdicts index or look up verdicts in it.
+
+    Args:
+        args (argparse.Namespace): The parsed 'index' subcommand arguments.
+        settings (config.config_reader.Settings): The validated settings.
+
+    Returns:
+        None
+    """
+    from time import perf_counter
+    from index_manager.verdict_index import VerdictIndex
+
+    with VerdictIndex(settings.index_db_path()) as index:
+        if args.action == "refresh":
+            print(">> Refreshing the verdicts index")
+            for year, rows in index.refresh(settings.verdicts_dir, settings.verdicts_file).items():
+                print(f"Year {year}: {rows} new rows indexed")
+            print("Indexed verdicts by year:", index.count())
+            print()
+            return
+        print(">> Verdicts lookup")
+        lookup_start = perf_counter()
+        rows = index.lookup(ecli=args.ecli, court=args.court, recourse=args.recourse, number=args.number, year=args.year, limit=args.limit)
+        elapsed = perf_counter() - lookup_start
+        for row in rows:
+            print(";".join(str(row[column]) for column in ("anno", "codice_ecli", "tribunale_codice", "sentenza_numero", "ricorso_numero", "sentenza_file")))
+        print(f"Verdicts found: {len(rows)} ({elapsed * 1000:.3f} ms)")
+        print()
+
+def verify_command(args, settings) -> None:
+    """
+    Verify the crawl of a query and year, fetching again only the missing or short pages.
+    The partitions of a partitioned crawl are verified before their merge, so only their status is printed.
+
+    Args:
+        args (argparse.Namespace): The parsed 'verify' subcommand arguments.
+        settings (config.config_reader.Settings): The validated settings.
+
+    Returns:
+        None
+    """
+    from utility_manager.manifest import read_manifest
+
+    manifest = read_manifest(settings.verdicts_dir, settings.manifest_file_for(args.year))
+    entry = manifest.get(args.query)
+    if entry is None or "res_num" not in entry and "partitioned_by" not in entry:
+        print(f"WARNING! No crawl of '{args.query}' in the {args.year} manifest, run the scraper first")
+        print()
+        return
+    if "partitioned_by" in entry:
+        print(f">> Partitions of '{args.query}' ({args.year}), by {entry['partitioned_by']}")
+        print(f"Whole query: results {entry.get('res_num')}, rows {entry.get('rows')}, complete {entry.get('complete', False)}")
+        for key, part_entry in sorted(manifest.items()):
+            if key.startswith(args.query + " ["):
+                print(f"{key}: results {part_entry.get('res_num')}, rows {part_entry.get('rows')}, complete {part_entry.get('complete', False)}")
+        print()
+        return
+    scraper = load_script("01_scraper")
+    scraper.verify(args.query, args.year, settings, settings.verdicts_file, recheck=True)
+    scraper.refresh_index(settings)
+
+def scan_command(args, settings) -> None:
+    """
+    Check the downloaded files of each year (format, size and hash, in parallel processes) against the year index:
+    missing, orphaned and corrupt files. With repair, the corrupt files listed in the index are deleted and downloaded again with the missing ones.
+
+    Args:
+        args (argparse.Namespace): The parsed 'scan' subcommand arguments.
+        settings (config.config_reader.Settings): The validated settings.
+
+    Returns:
+        None
+    """
+    from download_manager.integrity import IntegrityStore, scan_year
+
+    verdict_dir = Path(settings.verdicts_dir)
+    year_to = args.year_to or args.year
+    for year in range(args.year, year_to + 1):
+        print(f">> Integrity scan of {verdict_dir / str(year)}")
+        index_names = read_index_files(verdict_dir / settings.verdicts_file_for(year))
+        with IntegrityStore(settings.integrity_db_path()) as store, span("scan", year=year):
+            result = scan_year(store, verdict_dir / str(year), year, index_names, args.workers, args.full)
+        print(f"Files: {result['files']} ({result['scanned']} checked, {result['reused']} unchanged since the last scan)")
+        print("Files in the index not downloaded:", len(result["missing"]))
+        print("Files not in the index (orphaned):", len(result["orphaned"]))
+        for name in result["orphaned"][:args.show]:
+            print("-", name)
+        print("Corrupt files:", len(result["corrupt"]))
+        for name, reason in list(result["corrupt"].items())[:args.show]:
+            print(f"- {name}: {reason}")
+        print()
+        repairs = [name for name in result["corrupt"] if name in index_names] # corrupt orphaned files cannot be downloaded again, they are left as they are
+        if args.repair and (repairs or result["missing"]):
+            print(f">> Repairing {year}: {len(repairs)} corrupt files deleted, downloading them with the {len(result['missing'])} missing ones")
+            for name in repairs:
+                (verdict_dir / str(year) / name).unlink(missing_ok=True)
+            print()
+            load_script("02_downloader").download(year, year + 1, settings)
+
+def export_command(args, settings) -> None:
+    """
+    Export the verdicts indexes, the downloaded files metadata and the analyzer time series to the analytical
+    database (only the sources changed since the last export are loaded again), then show the download coverage.
+
+    Args:
+        args (argparse.Namespace): The parsed 'export' subcommand arguments.
+        settings (config.config_reader.Settings): The validated settings.
+
+    Returns:
+        None
+    """
+    from time import perf_counter
+    from export_manager.analytics_db import AnalyticsDB, export_all
+
+    print(f">> Exporting to {settings.export_db_path()} ({settings.export_backend})")
+    export_start = perf_counter()
+    with AnalyticsDB(settings.export_db_path(), settings.export_backend) as db:
+        loaded = export_all(db, settings.verdicts_dir, settings.verdicts_file, Path(settings.verdicts_stats) / settings.verdicts_timeseries_file, args.full)
+        for source, rows in loaded.items():
+            print(f"{source}: {'unchanged' if rows is None else f'{rows} rows stored'}")
+        print(f"Export time: {perf_counter() - export_start:.3f}s")
+        print()
+
+        print(">> Download coverage by year and court")
+        query_start = perf_counter()
+        columns, rows = db.query(args.sql or "SELECT * FROM coverage_summary ORDER BY anno, tribunale_codice")
+        elapsed = perf_counter() - query_start
+        print(";".join(columns))
+        for row in rows[:args.show]:
+            print(";".join(str(value) for value in row))
+        print(f"Rows: {len(rows)} ({elapsed * 1000:.3f} ms)")
+        print()
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Build the command line parser with its subcommands.
+
+    Returns:
+        argparse.ArgumentParser: The parser.
+    """
+    parser = argparse.ArgumentParser(prog=script_name, description="Italian Administrative Justice verdicts scraper")
+    parser.add_argument("--config", help="configuration file (default: config/config.yml)")
+    parser.add_argument("--set", dest="overrides", action="append", default=[], metavar="KEY=VALUE", help="override a configuration key")
+    parser.add_argument("--profile", nargs="?", const="trace", choices=PROFILE_MODES, help="write a trace of the stages (plus a cProfile or sampling profile of the first --profile-window seconds)")
+    parser.add_argument("--profile-window", type=float, default=60.0, metavar="SECONDS", help="seconds profiled by cprofile/sample (default 60)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    p_scrape = subparsers.add_parser("scrape", help="build the verdicts index of a query and year")
+    p_scrape.add_argument("query")
+    p_scrape.add_argument("year", type=int)
+    p_scrape.add_argument("--partition", choices=("court", "date"), help="split the query by court or by date window and crawl the partitions in parallel")
+    p_scrape.add_argument("--windows", type=int, default=12, help="date windows of the year (--partition date)")
+    p_scrape.add_argument("--from-cache", action="store_true", help="re-parse the cached result pages, page 0 included, without requesting them again")
+
+    p_download = subparsers.add_parser("download", help="download the files listed in the verdicts index")
+    p_download.add_argument("year", type=int)
+    p_download.add_argument("--to", dest="year_to", type=int, help="last year to be downloaded (default: year)")
+    p_download.add_argument("--limit", type=int, help="maximum number of files downloaded in this run (the highest priority ones)")
+    p_download.add_argument("--job", dest="jobs", action="append", default=[], metavar="COURT[:YEAR]@DEADLINE", help="download the files of a court (and year) first, by a deadline, e.g. cds:2023@2026-10-20T18:00")
+
+    p_analyze = subparsers.add_parser("analyze", help="count the downloaded files and save the stats")
+    p_analyze.add_argument("--full", action="store_true", help="list every directory again instead of trusting the unchanged directory mtimes")
+
+    p_pipeline = subparsers.add_parser("pipeline", help="scrape, download and analyze a query and year")
+    p_pipeline.add_argument("query")
+    p_pipeline.add_argument("year", type=int)
+
+    p_plan = subparsers.add_parser("plan", help="estimate pages, downloads, bytes and time without crawling")
+    p_plan.add_argument("year", type=int)
+    p_plan.add_argument("--query", help="query to be planned (page 0 only is submitted); omit to plan the downloads only")
+    p_plan.add_argument("--workers", type=int, default=1, help="parallel download workers for the time estimate")
+    p_plan.add_argument("--offline", action="store_true", help="use the manifest of the last crawl instead of the website")
+
+    p_verify = subparsers.add_parser("verify", help="reconcile a crawl with its results number and fetch again only the missing pages")
+    p_verify.add_argument("query")
+    p_verify.add_argument("year", type=int)
+
+    p_scan = subparsers.add_parser("scan", help="check format, size and hash of the downloaded files against the index (missing, orphaned, corrupt)")
+    p_scan.add_argument("year", type=int)
+    p_scan.add_argument("--to", dest="year_to", type=int, help="last year to be scanned (default: year)")
+    p_scan.add_argument("--workers", type=int, help="worker processes (default: CPU count)")
+    p_scan.add_argument("--full", action="store_true", help="check again the files unchanged since the last scan")
+    p_scan.add_argument("--repair", action="store_true", help="delete the corrupt files and download them again with the missing ones")
+    p_scan.add_argument("--show", type=int, default=20, help="orphaned and corrupt files listed (default 20)")
+
+    p_export = subparsers.add_parser("export", help="export indexes, downloaded files and stats to the analytical database (EXPORT_DB)")
+    p_export.add_argument("--full", action="store_true", help="load every source again, not only the changed ones")
+    p_export.add_argument("--sql", help="query run after the export instead of the coverage view (e.g. \"SELECT * FROM files LIMIT 5\")")
+    p_export.add_argument("--show", type=int, default=50, help="rows of the query printed (default 50)")
+
+    p_index = subparsers.add_parser("index", help="refresh the SQLite verdicts index or look up verdicts in it")
+    p_index.add_argument("action", choices=("refresh", "lookup"))
+    p_index.add_argument("--ecli")
+    p_index.add_argument("--court", help="court code (tribunale_codice), e.g. cds")
+    p_index.add_argument("--recourse", help="recourse number (ricorso_numero)")
+    p_index.add_argument("--number", help="verdict number (sentenza_numero)")
+    p_index.add_argument("--year", type=int)
+    p_index.add_argument("--limit", type=int)
+
+    return parser
+
+### MAIN ###
+def main(argv:list=None) -> int:
+    args = build_parser().parse_args(argv)
+
+    overrides = {}
+    for pair in args.overrides:
+        if "=" not in pair:
+            print(f"WARNING! Invalid override '{pair}', expected KEY=VALUE")
+            return 2
+        key, value = pair.split("=", 1)
+        overrides[key.strip().upper()] = value
+    try:
+        settings = get_settings(args.config, overrides)
+    except ValueError as e:
+        print(f"WARNING! Invalid configuration: {e}")
+        return 2
+    try:
+        from download_manager.scheduler import parse_job
+        jobs = [parse_job(spec) for spec in getattr(args, "jobs", [])]
+    except ValueError as e:
+        print(f"WARNING! {e}")
+        return 2
+
+    print()
+    print(f"*** PROGRAM START ({script_name} {args.command}) ***")
+    print()
+
+    start_time = datetime.now().replace(microsecond=0)
+
+    print("Start process:", start_time)
+    print()
+
+    if args.profile:
+        start_profiling(args.profile, args.profile_window, settings.profile_dir)
+
+    try:
+        if args.command == "index":
+            index_command(args, settings)
+        if args.command == "plan":
+            print_plan(plan(args.query, args.year, settings, args.workers, args.offline))
+        if args.command in ("scrape", "pipeline"):
+            with span("scrape", query=args.query, year=args.year):
+                if getattr(args, "partition", None):
+                    load_script("01_scraper").scrape_partitioned(args.query, args.year, settings, args.partition, args.windows, getattr(args, "from_cache", False))
+                else:
+                    load_script("01_scraper").scrape(args.query, args.year, settings, getattr(args, "from_cache", False))
+        if args.command == "export":
+            try:
+                export_command(args, settings)
+            except ValueError as e:
+                print(f"WARNING! {e}")
+                print()
+        if args.command == "scan":
+            scan_command(args, settings)
+        if args.command == "verify":
+            verify_command(args, settings)
+        if args.command in ("download", "pipeline"):
+            year_to = getattr(args, "year_to", None) or args.year
+            with span("download", year=args.year):
+                load_script("02_downloader").download(args.year, year_to + 1, settings, getattr(args, "limit", None), jobs)
+        if args.command in ("analyze", "pipeline"):
+            with span("analyze"):
+                load_script("03_analyzer").analyze(settings, getattr(args, "full", False))
+    finally: # the profile of a failed or interrupted run is written too
+        finish_profiling()
+
+    end_time = datetime.now().replace(microsecond=0)
+    delta_time = end_time - start_time
+
+    print("End process:", end_time)
+    print("Time to finish:", delta_time)
+    print()
+
+    print()
+    print("*** PROGRAM END ***")
+    print()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,264 @@
+# verdict_index.py
+# SQLite index of the verdicts of all the scraped years (ECLI, court, recourse number, verdict number, year lookups)
+
+import hashlib
+import sqlite3
+from pathlib import Path
+
+INDEX_COLUMNS = ["pagina", "codice_ecli", "provvedimento_titolo", "provvedimento_tipo", "sentenza_numero", "tribunale_codice", "tribunale_citta", "tribunale_sezione", "ricorso_numero", "sentenza_url", "sentenza_file"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    anno INTEGER NOT NULL,
+    sentenza_file TEXT NOT NULL,
+    pagina INTEGER,
+    codice_ecli TEXT,
+    provvedimento_titolo TEXT,
+    provvedimento_tipo TEXT,
+    sentenza_numero TEXT,
+    tribunale_codice TEXT,
+    tribunale_citta TEXT,
+    tribunale_sezione TEXT,
+    ricorso_numero TEXT,
+    sentenza_url TEXT,
+    PRIMARY KEY (anno, sentenza_file)
+);
+CREATE INDEX IF NOT EXISTS idx_verdicts_ecli ON verdicts (codice_ecli);
+CREATE INDEX IF NOT EXISTS idx_verdicts_court_recourse ON verdicts (tribunale_codice, ricorso_numero);
+CREATE INDEX IF NOT EXISTS idx_verdicts_court_number ON verdicts (tribunale_codice, sentenza_numero);
+CREATE INDEX IF NOT EXISTS idx_verdicts_recourse ON verdicts (ricorso_numero);
+CREATE TABLE IF NOT EXISTS sources (
+    file_name TEXT PRIMARY KEY,
+    anno INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    bytes_read INTEGER NOT NULL,
+    prefix_sha256 TEXT NOT NULL
+);
+"""
+
+def split_index_row(line:str) -> list:
+    """
+    Splits a line of a verdicts index CSV in its 11 columns. The title is the only free-text column,
+    so the line is split from the left up to the title and from the right after it (a ';' in the title is kept).
+
+    Parameters
+    -----------------------
+    line: str,
+        a data line of the index (without the line terminator)
+
+    Returns
+    -----------------------
+    The list of the column values, or None if the line has fewer columns.
+    """
+    left = line.split(";", 2)
+    if len(left) < 3:
+        return None
+    right = left[2].rsplit(";", 8)
+    if len(right) < 9:
+        return None
+    return left[:2] + right
+
+
+INDEX_HEADER = ";".join(INDEX_COLUMNS)
+
+
+def parse_index_row(line:str, year:int) -> list:
+    """
+    Parses a line of a year index file in the row of the verdicts table (year, page number as integer, then the
+    other columns).
+
+    Parameters
+    -----------------------
+    line: str,
+        a line of the index (without the line terminator)
+    year: int,
+        year of the index file
+
+    Returns
+    -----------------------
+    The list of the row values, or None for the header, an empty line or a malformed line.
+    """
+    if not line or line == INDEX_HEADER:
+        return None
+    row = split_index_row(line)
+    if row is None:
+        return None
+    row[0] = int(row[0]) if row[0].isdigit() else None
+    return [year] + row
+
+
+def index_files(verdict_dir:str, verdicts_file:str) -> list:
+    """
+    Lists the year index files of the verdicts directory (the 'Y' placeholder of VERDICTS_FILE matches a 4-digit year).
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the index files
+    verdicts_file: str,
+        VERDICTS_FILE setting (e.g. Y_verdicts.csv)
+
+    Returns
+    -----------------------
+    List of (year, path) tuples sorted by year.
+    """
+    prefix, suffix = verdicts_file.split("Y", 1)
+    found = []
+    for path in Path(verdict_dir).glob(verdicts_file.replace("Y", "[0-9][0-9][0-9][0-9]", 1)):
+        year = path.name[len(prefix):len(path.name) - len(suffix)]
+        if year.isdigit():
+            found.append((int(year), path))
+    return sorted(found)
+
+
+class VerdictIndex:
+    """
+    Persistent SQLite index of the verdicts index CSV files, refreshed incrementally:
+    for each file it remembers size, mtime, bytes already read and the SHA-256 of those bytes, and loads only the rows
+    appended since then; a file rewritten before that point (e.g. duplicated rows removed) is loaded again in full.
+    """
+
+    def __init__(self, db_path:str):
+        """
+        Parameters
+        -----------------------
+        db_path: str,
+            SQLite database file (created if missing)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path))
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        columns = [row["name"] for row in self.conn.execute("PRAGMA table_info(sources)")]
+        if columns and "prefix_sha256" not in columns:
+            self.conn.execute("DROP TABLE sources") # sources of an older version (rows read only): every file is loaded again
+        self.conn.executescript(SCHEMA)
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def refresh_file(self, year:int, path:Path, batch_size:int=5000) -> int:
+        """
+        Loads the rows of a year index file that are not indexed yet.
+
+        Parameters
+        -----------------------
+        year: int,
+            year of the index file
+        path: Path,
+            index CSV file
+        batch_size: int,
+            rows per executemany batch
+
+        Returns
+        -----------------------
+        The number of rows loaded.
+        """
+        stat = path.stat()
+        source = self.conn.execute("SELECT size, mtime_ns, bytes_read, prefix_sha256 FROM sources WHERE file_name = ?", (path.name,)).fetchone()
+        if source is not None and source["size"] == stat.st_size and source["mtime_ns"] == stat.st_mtime_ns:
+            return 0 # unchanged
+        insert = f"INSERT OR REPLACE INTO verdicts (anno, {', '.join(INDEX_COLUMNS)}) VALUES ({', '.join('?' * (len(INDEX_COLUMNS) + 1))})"
+        loaded = 0
+        batch = []
+        with self.conn, open(path, 'rb') as fp:
+            # the rows already read are skipped only if the bytes before them did not change (the scraper appends rows,
+            # but the verification rewrites the file when it removes duplicated rows)
+            bytes_read = 0
+            digest = hashlib.sha256()
+            if source is not None and 0 < source["bytes_read"] <= stat.st_size:
+                remaining = source["bytes_read"]
+                while remaining > 0:
+                    block = fp.read(min(remaining, 1 << 20))
+                    if not block:
+                        break
+                    digest.update(block)
+                    remaining -= len(block)
+                if remaining == 0 and digest.hexdigest() == source["prefix_sha256"]:
+                    bytes_read = source["bytes_read"]
+            if bytes_read == 0:
+                fp.seek(0)
+                digest = hashlib.sha256()
+                self.conn.execute("DELETE FROM verdicts WHERE anno = ?", (year,)) # full reload of a rewritten file
+            for raw_line in fp:
+                digest.update(raw_line)
+                bytes_read += len(raw_line)
+                row = parse_index_row(raw_line.decode("utf-8", errors="replace").rstrip("\r\n"), year)
+                if row is None:
+                    continue
+                batch.append(row)
+                if len(batch) >= batch_size:
+                    self.conn.executemany(insert, batch)
+                    loaded += len(batch)
+                    batch = []
+            if batch:
+                self.conn.executemany(insert, batch)
+                loaded += len(batch)
+            self.conn.execute("INSERT OR REPLACE INTO sources (file_name, anno, size, mtime_ns, bytes_read, prefix_sha256) VALUES (?, ?, ?, ?, ?, ?)",
+                              (path.name, year, stat.st_size, stat.st_mtime_ns, bytes_read, digest.hexdigest()))
+        return loaded
+
+    def refresh(self, verdict_dir:str, verdicts_file:str) -> dict:
+        """
+        Refreshes the index from all the year index files of the verdicts directory.
+
+        Parameters
+        -----------------------
+        verdict_dir: str,
+            directory of the index files
+        verdicts_file: str,
+            VERDICTS_FILE setting (e.g. Y_verdicts.csv)
+
+        Returns
+        -----------------------
+        Dictionary {year: rows loaded}.
+        """
+        return {year: self.refresh_file(year, path) for year, path in index_files(verdict_dir, verdicts_file)}
+
+    def lookup(self, ecli:str=None, court:str=None, recourse:str=None, number:str=None, year:int=None, limit:int=None) -> list:
+        """
+        Returns the indexed verdicts matching all the given criteria.
+
+        Parameters
+        -----------------------
+        ecli: str,
+            ECLI code (codice_ecli)
+        court: str,
+            court code (tribunale_codice), e.g. cds
+        recourse: str,
+            recourse number (ricorso_numero)
+        number: str,
+            verdict number (sentenza_numero)
+        year: int,
+            year of the index
+        limit: int,
+            maximum number of rows
+
+        Returns
+        -----------------------
+        List of dictionaries (one per verdict, the index columns plus 'anno').
+        """
+        criteria = [("codice_ecli", ecli), ("tribunale_codice", court), ("ricorso_numero", recourse), ("sentenza_numero", number), ("anno", year)]
+        where = [(column, value) for column, value in criteria if value is not None]
+        sql = "SELECT * FROM verdicts"
+        if where:
+            sql += " WHERE " + " AND ".join(f"{column} = ?" for column, _ in where)
+        sql += " ORDER BY anno, sentenza_file"
+        if limit:
+            sql += f" LIMIT {int(limit)}"
+        return [dict(row) for row in self.conn.execute(sql, [value for _, value in where])]
+
+    def count(self) -> dict:
+        """
+        Returns the number of indexed verdicts by year.
+        """
+        return {row["anno"]: row["n"] for row in self.conn.execute("SELECT anno, COUNT(*) AS n FROM verdicts GROUP BY anno ORDER BY anno")}
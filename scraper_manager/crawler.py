@@ -0,0 +1,527 @@
+# crawler.py
+# Scraper core: search form handling, result page parsing and a generator of the verdicts of a query
+# mechanicalsoup and bs4 are imported inside the functions that use them
+
+from __future__ import annotations
+import re
+import threading
+from time import perf_counter
+from typing import TYPE_CHECKING, Callable, Iterator
+
+if TYPE_CHECKING:
+    import mechanicalsoup
+    import requests
+
+from verdict import Verdict
+from config.config_reader import get_settings
+from scraper_manager.page_cache import PageCache
+from scraper_manager.session_store import SessionStore
+from utility_manager.profiler import span
+
+# search form
+form_id = "_GaSearch_INSTANCE_2NDgCF3zWBwk_provvedimentiForm"
+
+page_cache = None # result pages cache (see get_page_cache)
+page_cache_lock = threading.Lock()
+session_store = None # saved search session (see get_session_store)
+
+def fill_search_form(browser:mechanicalsoup.stateful_browser.StatefulBrowser, input_search:str, year_search:int, paging:int, filters:dict=None) -> None:
+    """
+    Select the IAJ search form in the current page and fill in query, paging, verdict type and year.
+
+    Args:
+        browser (mechanicalsoup.stateful_browser.StatefulBrowser): The browser object positioned on a page with the search form.
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        paging (int): The number of results per page.
+        filters (dict): Extra form fields of a partition, e.g. {court field: 'cds'} (optional).
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the form has no field (or option) for a filter: the partition cannot be crawled.
+    """
+    import mechanicalsoup
+
+    browser.select_form('form[id="'+form_id+'"]') # get the form data by id
+    # print(browser.get_current_form().print_summary()) # get the content objects of the form (debug)
+
+    browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_searchtextProvvedimenti"] = input_search # textbox
+    browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_pageResultsProvvedimenti"] = paging # selectbox
+    browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_TipoProvvedimentoItem"] = "Sentenza" # selectbox
+    browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_DataYearItem"] = str(year_search) # selectbox
+    for field_name, value in (filters or {}).items():
+        try:
+            browser[field_name] = value
+        except mechanicalsoup.LinkNotFoundError:
+            raise ValueError(f"The search form does not accept the filter {field_name}={value!r} (check the FORM_* settings)") from None
+
+def read_result_summary(html_content, paging:int=None) -> tuple:
+    """
+    Read the number of results and the last page index from the first results page.
+    Pages goes to 0 to n (visualized in the web page as 1 to n+1).
+    The last page comes from the onclick of the last 'pagination-li'; with paging, it is checked against
+    the one computed from the results number and the larger is used (a page too many is empty, a page too few is lost).
+
+    Args:
+        html_content (bs4.BeautifulSoup): The parsed first results page.
+        paging (int): The number of results per page (optional).
+
+    Returns:
+        tuple: (results number, last page index).
+    """
+    res_num = int(html_content.strong.string) # results number
+    total_pages = None
+    temp_last_page_1 = html_content.find_all('li', {'class':'pagination-li'}) # [-1] contains the last page
+    # print("temp_last_page 1:", temp_last_page_1[-1]) # debug
+    if temp_last_page_1:
+        for tag in temp_last_page_1[-1].find_all('a'):
+            try:
+                if re.match('changePage',tag['onclick']):           # if onclick attribute exist, it will match for changePage, if success will print
+                    # print("Last page object:", x['onclick'])      # debug
+                    onclick = tag['onclick']                        # string value inside onclik
+                    onclick_value = re.findall("[0-9]+",onclick)    # get the numbers inside the Javascript function (is a list)
+                    total_pages = int(onclick_value[0])
+                    # print("Last page value:", str(l_page))        # debug
+            except (KeyError, IndexError, ValueError):
+                print("Error on changePage RegEx")
+                print()
+    if paging:
+        computed_pages = max((res_num - 1) // paging, 0) # number of the pages to be parsed from the results number
+        if total_pages is None:
+            print(f"WARNING! Last page not found in the pagination, computed from the results: {computed_pages}")
+            total_pages = computed_pages
+        elif total_pages != computed_pages:
+            print(f"WARNING! Last page in the pagination ({total_pages}) differs from the one computed from the results ({computed_pages})")
+            total_pages = max(total_pages, computed_pages)
+    return res_num, total_pages or 0
+
+def open_search_page(url_search:str) -> mechanicalsoup.stateful_browser.StatefulBrowser:
+    """
+    Start a browser and move it to the verdicts search page (<url>/dcsnprr).
+
+    Args:
+        url_search (str): The IAJ website URL.
+
+    Returns:
+        mechanicalsoup.stateful_browser.StatefulBrowser: The browser object positioned on the search form.
+    """
+    import mechanicalsoup
+
+    browser = mechanicalsoup.StatefulBrowser() # web scraper object
+    # print(type(browser)) # <class 'mechanicalsoup.stateful_browser.StatefulBrowser'>
+    browser.open(url_search)
+    browser.follow_link("dcsnprr") # moves to <url>/dcsnprr
+    return browser
+
+def get_session_store() -> SessionStore:
+    """
+    Return the saved search session store built from the settings (created on the first call).
+
+    Returns:
+        SessionStore: The session store (disabled if SESSION_TTL is 0).
+    """
+    global session_store
+    with page_cache_lock:
+        if session_store is None:
+            settings = get_settings()
+            session_store = SessionStore(settings.session_file, settings.session_ttl, form_id)
+    return session_store
+
+def open_session_browser(url_search:str) -> tuple:
+    """
+    Return a browser on the search form: from the saved session if it is valid (no request), else from a new
+    handshake (home page and search page), whose session is saved for the next runs.
+
+    Args:
+        url_search (str): The IAJ website URL.
+
+    Returns:
+        tuple: (browser, True if it comes from the saved session).
+    """
+    store = get_session_store()
+    with span("session.load"):
+        browser = store.load(url_search)
+    if browser is not None:
+        return browser, True
+    browser = open_search_page(url_search)
+    store.save(browser, url_search)
+    return browser, False
+
+def is_results_page(response:requests.models.Response) -> bool:
+    """
+    Check that a response is a results page of the search form (a stale session gets an error or another page).
+
+    Args:
+        response (requests.models.Response): The response of a form submission.
+
+    Returns:
+        bool: True if it is a results page.
+    """
+    return response.ok and form_id in response.text and "<strong" in response.text
+
+def fetch_result_summary(input_search:str, year_search:int, paging:int, browser:mechanicalsoup.stateful_browser.StatefulBrowser) -> tuple:
+    """
+    Submit only the first results page of a query and read its summary (used to plan a crawl).
+
+    Args:
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        paging (int): The number of results per page.
+        browser (mechanicalsoup.stateful_browser.StatefulBrowser): The browser object positioned on the search form.
+
+    Returns:
+        tuple: (results number, last page index, seconds taken by the request).
+    """
+    from bs4 import BeautifulSoup as bs
+
+    fill_search_form(browser, input_search, year_search, paging)
+    request_start = perf_counter()
+    with span("submit_selected", page=0):
+        response = browser.submit_selected()
+    elapsed = perf_counter() - request_start
+    response.raise_for_status() # an error page has no results summary
+    res_num, total_pages = read_result_summary(bs(response.text, 'html.parser'), paging)
+    return res_num, total_pages, elapsed
+
+def submit_page(browser:mechanicalsoup.stateful_browser.StatefulBrowser, input_search:str, year_search:int, paging:int, page:int, filters:dict=None) -> requests.models.Response:
+    """
+    Fill in the search form and submit it for a results page (the 'step' field selects pages after the first one).
+
+    Args:
+        browser (mechanicalsoup.stateful_browser.StatefulBrowser): The browser object positioned on a page with the search form.
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        paging (int): The number of results per page.
+        page (int): The results page to be submitted.
+        filters (dict): Extra form fields of a partition (optional).
+
+    Returns:
+        requests.models.Response: The response of the web server.
+    """
+    import mechanicalsoup
+
+    fill_search_form(browser, input_search, year_search, paging, filters)
+    if (page != 0):
+        # the element "_GaSearch_INSTANCE_2NDgCF3zWBwk_step" exists only in a results page (e.g. not if page 0 came from the cache)
+        try:
+            browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_step"] = page
+        except mechanicalsoup.LinkNotFoundError:
+            with span("submit_selected", page=0):
+                browser.submit_selected() # move to the first results page, then select the page
+            fill_search_form(browser, input_search, year_search, paging, filters)
+            browser["_GaSearch_INSTANCE_2NDgCF3zWBwk_step"] = page
+    with span("submit_selected", page=page):
+        return browser.submit_selected()
+
+def get_page_cache() -> PageCache:
+    """
+    Return the result pages cache built from the settings (created on the first call, shared by the threads).
+
+    Returns:
+        PageCache: The page cache (disabled if PAGE_CACHE_TTL is 0).
+    """
+    global page_cache
+    with page_cache_lock:
+        if page_cache is None:
+            settings = get_settings()
+            page_cache = PageCache(settings.page_cache_dir, settings.page_cache_ttl, settings.page_cache_max_bytes)
+    return page_cache
+
+def text_or_none(tag_string) -> str:
+    """
+    Return a tag string as a plain str (a bs4 NavigableString keeps the whole parsed page alive).
+
+    Args:
+        tag_string (bs4.element.NavigableString): The string of a tag, or None.
+
+    Returns:
+        str: The plain string, or None.
+    """
+    return None if tag_string is None else str(tag_string)
+
+def parse_article(article) -> Verdict:
+    """
+    Extract a verdict (location, link, ECLI, etc...) from an <article> of a results page.
+
+    Args:
+        article (bs4.element.Tag): The <article> tag.
+
+    Returns:
+        Verdict: The verdict, with plain str values.
+    """
+    verdict = Verdict() # create a new verdict object and extract the data from <article>
+
+    # print(type(article.get("class"))) # the class is a list so [0] is the first attribute searched
+    if (article.get("class")[0] == "ricerca--item"):
+        for link in article.findAll("a"):
+            if (link.get("data-sede") != None):
+                # print(link["data-sede"]) # code of the tribunal
+                verdict.tribunal_code = str(link["data-sede"])
+                # print(link["href"])
+                # verdict.sentence_url = url + link["href"] # OLD URL, from 2022 it's changed and it's complete in the href
+                verdict.sentence_url = str(link["href"])
+                string_href = link["href"].split("&")
+                string_file_name = string_href[3].split("=")
+                string_file = link["data-sede"] + "_" + string_file_name[1]
+                # print(string_file)
+                verdict.sentence_filename = string_file
+    div_count = 0
+    for div in article.findAll("div", {"class": "col-sm-12"}):
+        div_count+=1
+        if (div_count==1): # title from the second div
+            a_count = 0
+            for ahref in div.findAll("a"):
+                a_count+=1
+                if (a_count==2):
+                    # print(ahref.string)
+                    verdict.sentence_title = text_or_none(ahref.string)
+        if (div_count==2): # type, city, section, number
+            # print(div)
+            bcount = 0
+            for b in div.findAll("b"):
+                bcount+=1
+                # print(b.string)
+                if (bcount==1):
+                    verdict.sentence_type = text_or_none(b.string)
+                if (bcount==2):
+                    verdict.tribunal_city = text_or_none(b.string)
+                if (bcount==3):
+                    verdict.tribunal_section = text_or_none(b.string)
+                if (bcount==4):
+                    verdict.sentence_number = text_or_none(b.string)
+        # div_count==3 not needed
+        if (div_count==4): # recourse number
+            # print(div)
+            for b in div.findAll("b"):
+                # print(b.string)
+                verdict.recourse_number = text_or_none(b.string)
+        if (div_count==5): # ecli
+            # print(div)
+            for b in div.findAll("b"):
+                # print(b.string)
+                verdict.sentence_ecli = text_or_none(b.string)
+        else:
+            verdict.sentence_ecli = None
+    return verdict
+
+def results_signature(html_text:str) -> tuple:
+    """
+    Return what identifies the results of a first page: the results number and the verdicts of the page
+    (a cached first page with another signature belongs to an older result set).
+
+    Args:
+        html_text (str): The first results page.
+
+    Returns:
+        tuple: (results number text, list of the CSV rows of the verdicts).
+    """
+    from bs4 import BeautifulSoup as bs
+
+    html_content = bs(html_text, 'html.parser')
+    res_num = text_or_none(html_content.strong.string) if html_content.strong is not None else None
+    rows = [parse_article(article).toCSV() for article in html_content.findAll("article")[:-1]]
+    html_content.decompose()
+    return res_num, rows
+
+def parse_verdicts(html_text:str, page:int=None) -> list:
+    """
+    Parse the verdicts of a results page (the last <article> of the page is not a verdict).
+
+    Args:
+        html_text (str): The results page.
+        page (int): The page number (for the profiling spans only).
+
+    Returns:
+        list: The Verdict objects of the page.
+    """
+    from bs4 import BeautifulSoup as bs
+
+    with span("response_parser.bs4", page=page):
+        html_content = bs(html_text, 'html.parser')
+    with span("response_parser.articles", page=page):
+        articles = html_content.findAll("article")[:-1] # -1 because the last article is not a verdicts
+        verdicts = [parse_article(article) for article in articles]
+    html_content.decompose() # free the parse tree now, not when the garbage collector finds it
+    return verdicts
+
+class VerdictStream:
+    """
+    Iterator over the verdicts of a (query, year) search, page by page, in constant memory:
+    the browser, the page chain and the page cache are handled inside, only one page is parsed at a time.
+    Page 0 is always requested to the website (unless from_cache): the cached pages are used only if the cached page 0
+    has the same results, otherwise they are fetched again.
+
+    Example:
+        for page, verdict in VerdictStream("appalt*", 2023):
+            sink.write(verdict)
+    """
+
+    def __init__(self, input_search:str, year_search:int, settings=None, filters:dict=None, page_increment:int=1, pages:list=None, browser:mechanicalsoup.stateful_browser.StatefulBrowser=None, on_summary:Callable=None, refresh:bool=False, from_cache:bool=False):
+        """
+        Args:
+            input_search (str): The search query or keywords.
+            year_search (int): The year of the judgment.
+            settings (config.config_reader.Settings): The settings (default: get_settings()).
+            filters (dict): Extra form fields of a partition (optional).
+            page_increment (int): First page after page 0 (page 0 verdicts are returned only if it is 1).
+            pages (list): Explicit pages to be read instead of the whole chain (optional, e.g. pages to be fetched again).
+            browser (mechanicalsoup.stateful_browser.StatefulBrowser): A browser on the search form (default: a new one).
+            on_summary (Callable): Called with (res_num, total_pages) once page 0 has been read.
+            refresh (bool): Fetch every page from the website, deleting its cached copy (e.g. pages fetched again because they were short).
+            from_cache (bool): Read page 0 from the cache too (re-parse a crawl already fetched, e.g. after a parser fix).
+        """
+        self.input_search = input_search
+        self.year_search = year_search
+        self.settings = settings or get_settings()
+        self.filters = filters
+        self.page_increment = page_increment
+        self.requested_pages = pages
+        self.browser = browser
+        self.warm = False # browser from the saved session, not yet validated by a response
+        self.on_summary = on_summary
+        self.refresh = refresh
+        self.from_cache = from_cache
+        self.res_num = None
+        self.total_pages = None
+
+    def fetch_page(self, page:int) -> str:
+        """
+        Return the text of a results page, from the page cache or submitting the form (always submitting it with refresh).
+
+        Args:
+            page (int): The page number.
+
+        Returns:
+            str: The results page.
+        """
+        cache = get_page_cache()
+        cache_key = self.cache_key(page)
+        if self.refresh:
+            cache.delete(cache_key) # the cached copy is the one being repaired
+        else:
+            with span("page_cache.get", page=page):
+                html_text = cache.get(cache_key)
+            if html_text is not None:
+                return html_text
+        if self.browser is None:
+            self.browser, self.warm = open_session_browser(self.settings.url_search)
+        response = self.submit(page)
+        # print(type(response)) # <class 'requests.models.Response'> (debug)
+        response.raise_for_status() # an error page is not parsed as an empty results page
+        html_text = response.text
+        if "<article" in html_text: # never cache error pages
+            cache.put(cache_key, html_text)
+        return html_text
+
+    def cache_key(self, page:int) -> str:
+        """
+        Return the page cache key of a results page of the search.
+        """
+        return PageCache.make_key(self.settings.url_search, self.input_search, self.year_search, self.settings.paging, page, self.filters)
+
+    def fetch_first_page(self) -> str:
+        """
+        Return page 0 from the website and decide whether the cached pages can be used: only if the cached page 0
+        has the same results number and verdicts (new verdicts shift every page of the chain).
+
+        Returns:
+            str: The first results page.
+        """
+        if self.refresh or self.from_cache:
+            return self.fetch_page(0)
+        cache = get_page_cache()
+        cached_text = cache.get(self.cache_key(0), count=False)
+        self.refresh = True
+        html_text = self.fetch_page(0)
+        if cached_text is not None:
+            with span("page_cache.compare"):
+                cached_results, results = results_signature(cached_text), results_signature(html_text)
+            self.refresh = cached_results != results
+            if self.refresh:
+                print(f"WARNING! Results changed since the cached pages ({cached_results[0]} results, now {results[0]}): every page is requested again")
+        return html_text
+
+    def submit(self, page:int) -> requests.models.Response:
+        """
+        Submit the form for a results page; if the browser comes from a saved session that the website does not accept
+        any more, the session is discarded and the page is submitted again after a new handshake.
+
+        Args:
+            page (int): The page number.
+
+        Returns:
+            requests.models.Response: The response of the web server.
+        """
+        import mechanicalsoup
+        import requests
+
+        paging = self.settings.paging
+        if not self.warm:
+            return submit_page(self.browser, self.input_search, self.year_search, paging, page, self.filters)
+        self.warm = False
+        try:
+            response = submit_page(self.browser, self.input_search, self.year_search, paging, page, self.filters)
+            if is_results_page(response):
+                return response
+        except (mechanicalsoup.LinkNotFoundError, requests.RequestException):
+            pass
+        print("WARNING! Saved search session not valid any more, starting a new one")
+        get_session_store().discard()
+        self.browser, _ = open_session_browser(self.settings.url_search)
+        return submit_page(self.browser, self.input_search, self.year_search, paging, page, self.filters)
+
+    def read_summary(self, html_text:str) -> None:
+        """
+        Read the number of results and the last page from page 0 and notify on_summary.
+        """
+        from bs4 import BeautifulSoup as bs
+
+        html_content = bs(html_text, 'html.parser')
+        self.res_num, self.total_pages = read_result_summary(html_content, self.settings.paging)
+        html_content.decompose()
+        if self.on_summary is not None:
+            self.on_summary(self.res_num, self.total_pages)
+
+    def pages(self) -> Iterator[tuple]:
+        """
+        Yield (page, list of Verdict) for each results page: page 0 first (it gives the number of pages),
+        then from page_increment to the last page, or only the requested pages.
+        """
+        html_text = self.fetch_first_page()
+        self.read_summary(html_text)
+        if self.requested_pages is not None:
+            page_list = sorted(set(self.requested_pages))
+        else:
+            page_list = ([0] if self.page_increment == 1 else []) + list(range(max(self.page_increment, 1), self.total_pages + 1))
+        for page in page_list:
+            if page != 0 or html_text is None:
+                html_text = self.fetch_page(page)
+            verdicts = parse_verdicts(html_text, page)
+            html_text = None # only the current page is kept
+            yield page, verdicts
+
+    def __iter__(self) -> Iterator[tuple]:
+        """
+        Yield (page, Verdict) for each verdict of the search.
+        """
+        for page, verdicts in self.pages():
+            for verdict in verdicts:
+                yield page, verdict
+
+def iter_verdicts(input_search:str, year_search:int, settings=None, filters:dict=None, from_cache:bool=False) -> Iterator[tuple]:
+    """
+    Yield (page, Verdict) for every verdict of a (query, year) search (see VerdictStream).
+
+    Args:
+        input_search (str): The search query or keywords.
+        year_search (int): The year of the judgment.
+        settings (config.config_reader.Settings): The settings (default: get_settings()).
+        filters (dict): Extra form fields of a partition (optional).
+        from_cache (bool): Read the pages from the cache, page 0 too (optional).
+
+    Returns:
+        Iterator[tuple]: The (page, Verdict) pairs.
+    """
+    return iter(VerdictStream(input_search, year_search, settings, filters, from_cache=from_cache))
@@ -0,0 +1,154 @@
+# page_cache.py
+# On-disk cache of the search result pages (gzip compressed, TTL expiry, size-bounded LRU eviction)
+
+import gzip
+import hashlib
+import json
+import os
+import time
+from pathlib import Path
+
+class PageCache:
+    """
+    Cache of the HTML result pages returned by the search form, one gzip file per page.
+    Each file keeps the time it was stored in its mtime (for the TTL) and the time it was last read in its atime (for the LRU eviction).
+    """
+
+    suffix = ".html.gz"
+
+    def __init__(self, cache_dir:str, ttl_seconds:int, max_bytes:int):
+        """
+        Parameters
+        -----------------------
+        cache_dir: str,
+            directory of the cache files
+        ttl_seconds: int,
+            seconds after which a page is stale (0 disables the cache)
+        max_bytes: int,
+            maximum size of the cache files; the least recently used pages are evicted beyond it
+        """
+        self.cache_dir = Path(cache_dir)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._total_bytes = None # computed on the first write
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    @staticmethod
+    def make_key(url_search:str, input_search:str, year_search:int, paging:int, page:int, filters:dict=None) -> str:
+        """
+        Returns the cache key of a results page: a hash of the website URL, query, year, paging, page (step) and any extra form filters.
+        """
+        payload = json.dumps([url_search, input_search, int(year_search), int(paging), int(page), filters or {}], sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _path(self, key:str) -> Path:
+        return self.cache_dir / key[:2] / (key + self.suffix)
+
+    def get(self, key:str, count:bool=True):
+        """
+        Returns the cached page text, or None if it is missing or older than the TTL (stale pages are deleted).
+        With count False the read is not counted in the hits and misses (e.g. a page only compared with the live one).
+        """
+        if not self.enabled:
+            return None
+        path = self._path(key)
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            self.misses += count
+            return None
+        now = time.time()
+        if now - stat.st_mtime > self.ttl_seconds:
+            self._remove(path, stat.st_size)
+            self.misses += count
+            return None
+        try:
+            with gzip.open(path, "rt", encoding="utf-8") as fp:
+                text = fp.read()
+        except (OSError, EOFError):
+            self._remove(path, stat.st_size) # truncated or corrupted entry
+            self.misses += count
+            return None
+        os.utime(path, (now, stat.st_mtime)) # record the access for the LRU eviction, keep the stored time
+        self.hits += count
+        return text
+
+    def delete(self, key:str) -> None:
+        """
+        Deletes a cached page, if any, before the page is requested again (counted as a miss).
+        """
+        if not self.enabled:
+            return
+        self.misses += 1
+        path = self._path(key)
+        try:
+            size = path.stat().st_size
+        except FileNotFoundError:
+            return
+        self._remove(path, size)
+
+    def put(self, key:str, text:str) -> None:
+        """
+        Stores a page (atomically) and evicts the least recently used pages if the cache is over its size.
+        """
+        if not self.enabled:
+            return
+        path = self._path(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        temp_path = path.with_name(path.name + ".temp")
+        with gzip.open(temp_path, "wt", encoding="utf-8", compresslevel=6) as fp:
+            fp.write(text)
+        old_size = path.stat().st_size if path.exists() else 0
+        os.replace(temp_path, path)
+        if self._total_bytes is None:
+            self._total_bytes = self.size()
+        else:
+            self._total_bytes += path.stat().st_size - old_size
+        if self._total_bytes > self.max_bytes:
+            self.evict()
+
+    def _remove(self, path:Path, size:int) -> None:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            return
+        if self._total_bytes is not None:
+            self._total_bytes -= size
+
+    def _entries(self) -> list:
+        return [(p, p.stat()) for p in self.cache_dir.glob("*/*" + self.suffix)] if self.cache_dir.exists() else []
+
+    def size(self) -> int:
+        """
+        Returns the total size in bytes of the cache files.
+        """
+        return sum(stat.st_size for _, stat in self._entries())
+
+    def evict(self) -> int:
+        """
+        Deletes the expired pages, then the least recently used ones until the cache is within its size.
+
+        Returns
+        -----------------------
+        The number of pages deleted.
+        """
+        now = time.time()
+        entries = sorted(self._entries(), key=lambda item: item[1].st_atime)
+        total = sum(stat.st_size for _, stat in entries)
+        deleted = 0
+        for path, stat in entries:
+            if total <= self.max_bytes and now - stat.st_mtime <= self.ttl_seconds:
+                continue
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            total -= stat.st_size
+            deleted += 1
+        self._total_bytes = total
+        return deleted
@@ -0,0 +1,148 @@
+# partitions.py
+# Split a (query, year) crawl into independent sub-queries (by court or by date window) and merge their results
+
+from datetime import date, timedelta
+from pathlib import Path
+
+ECLI_COLUMN = 1 # codice_ecli, after the page number
+FILE_COLUMN = -1 # sentenza_file
+
+def read_courts(courts_dir:str, courts_file:str) -> list:
+    """
+    Reads the court codes from the first column of the courts CSV (header excluded).
+
+    Parameters
+    -----------------------
+    courts_dir: str,
+        directory of the courts file
+    courts_file: str,
+        courts CSV file name
+
+    Returns
+    -----------------------
+    List of court codes.
+    """
+    with open(Path(courts_dir) / courts_file, 'r', newline='') as fp:
+        lines = [line.strip().split(',')[0] for line in fp]
+    return [court for court in lines[1:] if court]
+
+
+def court_partitions(courts:list, court_field:str) -> list:
+    """
+    Builds one partition per court.
+
+    Parameters
+    -----------------------
+    courts: list,
+        court codes (e.g. from court/court.csv)
+    court_field: str,
+        name of the court selectbox of the search form
+
+    Returns
+    -----------------------
+    List of (label, form filters) tuples.
+    """
+    return [(court, {court_field: court}) for court in courts]
+
+
+def date_partitions(year:int, windows:int, date_from_field:str, date_to_field:str, date_format:str) -> list:
+    """
+    Builds the partitions of a year in consecutive date windows of (almost) equal length.
+
+    Parameters
+    -----------------------
+    year: int,
+        year of the verdicts
+    windows: int,
+        number of date windows (e.g. 12 for months of similar length)
+    date_from_field: str,
+        name of the 'date from' field of the search form
+    date_to_field: str,
+        name of the 'date to' field of the search form
+    date_format: str,
+        strftime format of the date fields
+
+    Returns
+    -----------------------
+    List of (label, form filters) tuples.
+    """
+    first_day = date(year, 1, 1)
+    days = (date(year + 1, 1, 1) - first_day).days
+    windows = max(1, min(windows, days))
+    partitions = []
+    for i in range(windows):
+        start = first_day + timedelta(days=days * i // windows)
+        end = first_day + timedelta(days=days * (i + 1) // windows - 1)
+        label = f"{start:%m%d}-{end:%m%d}"
+        partitions.append((label, {date_from_field: start.strftime(date_format), date_to_field: end.strftime(date_format)}))
+    return partitions
+
+
+def partition_file_name(verdicts_file:str, label:str) -> str:
+    """
+    Returns the index file name of a partition, e.g. Y_verdicts.csv -> Y_verdicts.part-cds.csv
+    (the label is lowercased so that it never contains the 'Y' year placeholder).
+    """
+    path = Path(verdicts_file)
+    return f"{path.stem}.part-{label.lower()}{path.suffix}"
+
+
+def row_key(row:list) -> str:
+    """
+    Returns the deduplication key of an index row: the ECLI, or the file name if the ECLI is not available.
+    """
+    ecli = row[ECLI_COLUMN] if len(row) > ECLI_COLUMN else "n.d."
+    return ecli if ecli and ecli != "n.d." else "file:" + row[FILE_COLUMN]
+
+
+def merge_partition_files(verdict_dir:str, file_name:str, partition_files:list, header:str) -> tuple:
+    """
+    Appends the rows of the partition index files to the year index, skipping the rows whose ECLI is already present,
+    then deletes the partition files.
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the index files
+    file_name: str,
+        year index file name (e.g. 2023_verdicts.csv)
+    partition_files: list,
+        partition index file names
+    header: str,
+        CSV header line (rows equal to it are skipped)
+
+    Returns
+    -----------------------
+    rows merged, duplicated rows skipped
+    """
+    index_path = Path(verdict_dir) / file_name
+    seen = set()
+    if index_path.exists():
+        with open(index_path, 'r', newline='') as fp:
+            for line in fp:
+                line = line.rstrip('\r\n')
+                if line and line != header:
+                    seen.add(row_key(line.split(';')))
+
+    merged = 0
+    duplicates = 0
+    with open(index_path, 'a', newline='') as out:
+        for part_name in partition_files:
+            part_path = Path(verdict_dir) / part_name
+            if not part_path.exists():
+                continue
+            with open(part_path, 'r', newline='') as fp:
+                for line in fp:
+                    row = line.rstrip('\r\n').split(';')
+                    if not row[0] or line.rstrip('\r\n') == header:
+                        continue
+                    key = row_key(row)
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    out.write(line if line.endswith('\n') else line + '\n')
+                    merged += 1
+    for part_name in partition_files:
+        (Path(verdict_dir) / part_name).unlink(missing_ok=True)
+    return merged, duplicates
@@ -0,0 +1,111 @@
+# session_store.py
+# Warm start of the scraper: the cookies of the website session and the search form page are saved on disk,
+# so a new run can submit its first results page without opening the home page and the search page again
+# mechanicalsoup is imported inside the functions that use it
+
+from __future__ import annotations
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import mechanicalsoup
+
+class SessionStore:
+    """
+    Saved session of the search form: a JSON file with the URL of the search page, its form (the template filled
+    in by each request) and the session cookies. The file keeps the time it was saved in its mtime (for the TTL).
+    """
+
+    def __init__(self, session_file:str, ttl_seconds:int, form_id:str):
+        """
+        Parameters
+        -----------------------
+        session_file: str,
+            JSON file of the saved session
+        ttl_seconds: int,
+            seconds after which the saved session is stale (0 disables the warm start)
+        form_id: str,
+            id of the search form (a saved page without it is not valid)
+        """
+        self.session_file = Path(session_file)
+        self.ttl_seconds = ttl_seconds
+        self.form_id = form_id
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def load(self, url_search:str) -> mechanicalsoup.stateful_browser.StatefulBrowser:
+        """
+        Returns a browser positioned on the saved search form with the saved cookies, without any request.
+
+        Parameters
+        -----------------------
+        url_search: str,
+            the IAJ website URL (a session saved for another website is not used)
+
+        Returns
+        -----------------------
+        The browser, or None if there is no valid session (missing, stale, expired cookies, another website or no form).
+        """
+        if not self.enabled:
+            return None
+        try:
+            if time.time() - self.session_file.stat().st_mtime > self.ttl_seconds:
+                return None
+            with open(self.session_file, 'r') as fp:
+                data = json.load(fp)
+        except (OSError, json.JSONDecodeError):
+            return None
+        now = time.time()
+        if data.get("url_search") != url_search or self.form_id not in data.get("form_html", ""):
+            return None
+        if any(cookie["expires"] is not None and cookie["expires"] <= now for cookie in data.get("cookies", [])):
+            return None
+
+        import mechanicalsoup
+
+        browser = mechanicalsoup.StatefulBrowser()
+        for cookie in data["cookies"]:
+            browser.session.cookies.set(cookie["name"], cookie["value"], domain=cookie["domain"], path=cookie["path"], expires=cookie["expires"], secure=cookie["secure"])
+        browser.open_fake_page(data["form_html"], url=data["page_url"])
+        return browser
+
+    def save(self, browser:mechanicalsoup.stateful_browser.StatefulBrowser, url_search:str) -> None:
+        """
+        Saves the session of a browser positioned on the search page: its URL, the search form and the cookies (atomic write).
+
+        Parameters
+        -----------------------
+        browser: mechanicalsoup.stateful_browser.StatefulBrowser,
+            the browser on the search page
+        url_search: str,
+            the IAJ website URL
+        """
+        if not self.enabled:
+            return
+        form = browser.page.find("form", id=self.form_id) if browser.page is not None else None
+        if form is None:
+            return
+        data = {
+            "url_search": url_search,
+            "page_url": browser.get_url(),
+            "form_html": f"<html><body>{form}</body></html>",
+            "cookies": [{"name": cookie.name, "value": cookie.value, "domain": cookie.domain, "path": cookie.path, "expires": cookie.expires, "secure": cookie.secure}
+                        for cookie in browser.session.cookies],
+        }
+        self.session_file.parent.mkdir(parents=True, exist_ok=True)
+        temp_file = self.session_file.with_name(f"{self.session_file.name}.{os.getpid()}.{threading.get_ident()}.temp")
+        with open(temp_file, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(temp_file, self.session_file)
+
+    def discard(self) -> None:
+        """
+        Deletes the saved session (e.g. when the website does not accept it any more).
+        """
+        self.session_file.unlink(missing_ok=True)
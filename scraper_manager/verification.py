@@ -0,0 +1,248 @@
+# verification.py
+# Completeness check of a crawl: reconcile the results number with the rows written page by page,
+# fetch again only the missing or short pages and remove the rows written twice
+
+import hashlib
+from os import replace as os_replace
+from pathlib import Path
+from typing import Callable
+
+from scraper_manager.partitions import row_key
+from utility_manager.manifest import manifest_lock, read_manifest, update_manifest_entry, write_manifest
+
+def expected_page_rows(res_num:int, paging:int, total_pages:int) -> dict:
+    """
+    Returns the number of verdicts expected in each results page: paging for every page but the last one.
+
+    Parameters
+    -----------------------
+    res_num: int,
+        results number of the search
+    paging: int,
+        results per page
+    total_pages: int,
+        last page index (pages go from 0 to total_pages)
+
+    Returns
+    -----------------------
+    Dictionary {page: expected rows}.
+    """
+    return {page: min(paging, max(res_num - page * paging, 0)) for page in range(total_pages + 1)}
+
+
+def check_pages(entry:dict, paging:int) -> dict:
+    """
+    Compares the pages recorded in a manifest entry with the expected ones.
+
+    Parameters
+    -----------------------
+    entry: dict,
+        manifest entry of a crawl (res_num, total_pages and the 'pages' records)
+    paging: int,
+        results per page
+
+    Returns
+    -----------------------
+    Dictionary with res_num, rows collected, missing pages, short pages (fewer rows than expected) and duplicated pages (written more than once).
+    If the results number has not been read (page 0 failed), res_num is None and page 0 is the only missing page.
+    """
+    res_num = entry.get("res_num")
+    pages = {int(page): record for page, record in entry.get("pages", {}).items()}
+    if res_num is None:
+        return {
+            "res_num": None,
+            "rows": sum(record["rows"] for record in pages.values()),
+            "missing": [0],
+            "short": [],
+            "duplicated": sorted(page for page, record in pages.items() if record["writes"] > 1),
+        }
+    expected = expected_page_rows(res_num, paging, entry.get("total_pages") or 0)
+    return {
+        "res_num": res_num,
+        "rows": sum(record["rows"] for page, record in pages.items() if page in expected),
+        "missing": sorted(page for page, rows in expected.items() if rows > 0 and page not in pages),
+        "short": sorted(page for page, rows in expected.items() if page in pages and pages[page]["rows"] < rows),
+        "duplicated": sorted(page for page, record in pages.items() if record["writes"] > 1),
+    }
+
+
+def crawl_keys_path(verdict_dir:str, manifest_file:str, key:str) -> Path:
+    """
+    Returns the file of the verdicts written by a crawl: one 'page;verdict key' line per row, appended page by page
+    (the year index mixes the rows of several queries, so the distinct verdicts of a crawl are counted from it).
+    """
+    digest = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    return Path(verdict_dir) / f"{Path(manifest_file).stem}_{digest}.keys"
+
+
+def record_page_keys(verdict_dir:str, manifest_file:str, key:str, page:int, rows:list) -> None:
+    """
+    Appends the verdict keys (ECLI, or file name) of the rows of a page written by a crawl.
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the index files
+    manifest_file: str,
+        manifest file name of the year
+    key: str,
+        manifest key of the crawl
+    page: int,
+        the results page
+    rows: list,
+        the index rows written for the page (lines without terminator)
+    """
+    with open(crawl_keys_path(verdict_dir, manifest_file, key), 'a') as fp:
+        fp.write("".join(f"{page};{row_key(row.split(';'))}\n" for row in rows))
+
+
+def count_crawl_verdicts(verdict_dir:str, manifest_file:str, key:str) -> int:
+    """
+    Returns the number of distinct verdicts written by a crawl (a verdict written on two pages is counted once),
+    or None if the crawl has no keys file (crawled by an older version).
+    """
+    path = crawl_keys_path(verdict_dir, manifest_file, key)
+    if not path.exists():
+        return None
+    with open(path, 'r') as fp:
+        return len({line.rstrip('\n').split(';', 1)[1] for line in fp if ';' in line})
+
+
+def reset_crawl(verdict_dir:str, manifest_file:str, key:str) -> None:
+    """
+    Forgets the pages and the verdicts recorded by the previous crawl of a query (a new whole crawl starts).
+    """
+    update_manifest_entry(verdict_dir, manifest_file, key, res_num=None, total_pages=None, pages={}, complete=False)
+    crawl_keys_path(verdict_dir, manifest_file, key).unlink(missing_ok=True)
+
+
+def dedupe_index_file(verdict_dir:str, file_name:str, header:str) -> int:
+    """
+    Rewrites an index file keeping only the first row of each verdict (same ECLI, or same file if the ECLI is missing).
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the index files
+    file_name: str,
+        index file name (e.g. 2023_verdicts.csv)
+    header: str,
+        CSV header line (kept once, at the top, if present)
+
+    Returns
+    -----------------------
+    The number of rows removed (the file is rewritten only if some are).
+    """
+    file_path = Path(verdict_dir) / file_name
+    if not file_path.exists():
+        return 0
+    temp_file_path = str(file_path) + '.temp'
+    seen = set()
+    removed = 0
+    with open(file_path, 'r', newline='') as fp, open(temp_file_path, 'w', newline='') as out:
+        for number, line in enumerate(fp):
+            stripped = line.rstrip('\r\n')
+            if not stripped:
+                continue
+            if stripped == header:
+                if number == 0:
+                    out.write(line)
+                continue
+            key = row_key(stripped.split(';'))
+            if key in seen:
+                removed += 1
+                continue
+            seen.add(key)
+            out.write(line)
+    if removed:
+        os_replace(temp_file_path, file_path)
+    else:
+        Path(temp_file_path).unlink()
+    return removed
+
+
+def reset_page_writes(verdict_dir:str, manifest_file:str, key:str) -> None:
+    """
+    Marks every recorded page of a crawl as written once (after the duplicated rows have been removed).
+    """
+    with manifest_lock:
+        manifest = read_manifest(verdict_dir, manifest_file)
+        for record in manifest.get(key, {}).get("pages", {}).values():
+            record["writes"] = 1
+        write_manifest(verdict_dir, manifest_file, manifest)
+
+
+def verify_crawl(verdict_dir:str, manifest_file:str, key:str, file_name:str, header:str, paging:int, fetch_pages:Callable, workers:int=4, max_rounds:int=3) -> dict:
+    """
+    Verifies that a crawl is complete and repairs it: duplicated rows are removed from the index (rows of a previous
+    crawl too) and the missing or short pages are fetched again in parallel, until every page has its expected rows
+    (or max_rounds is reached). The crawl is complete if the distinct verdicts it wrote are as many as the results.
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the index files
+    manifest_file: str,
+        manifest file name of the year
+    key: str,
+        manifest key of the crawl (query and filters)
+    file_name: str,
+        index file written by the crawl
+    header: str,
+        CSV header line
+    paging: int,
+        results per page
+    fetch_pages: Callable,
+        called with a list of pages, fetches them and appends their rows to file_name (recording the pages in the manifest
+        and their verdicts with record_page_keys); it raises if the pages could not be fetched
+    workers: int,
+        parallel page fetchers
+    max_rounds: int,
+        maximum number of repair rounds
+
+    Returns
+    -----------------------
+    The last check_pages report, with 'page_rows' (rows recorded page by page) and 'rows' (distinct verdicts),
+    plus 'complete', 'rounds', 'refetched', 'removed' (duplicated rows removed) and 'errors' (list of (pages, error)
+    of the fetches that failed; their pages are left for the next round).
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    def fetch_chunk(chunk:list):
+        try:
+            fetch_pages(chunk)
+        except Exception as e: # e.g. requests.ConnectionError: the pages stay missing
+            return chunk, f"{type(e).__name__}: {e}"
+        return None
+
+    refetched = 0
+    removed = 0
+    rounds = 0
+    errors = []
+    while True:
+        entry = read_manifest(verdict_dir, manifest_file).get(key, {})
+        report = check_pages(entry, paging)
+        removed += dedupe_index_file(verdict_dir, file_name, header) # the rows already written by this crawl or by a previous one
+        if report["duplicated"]:
+            reset_page_writes(verdict_dir, manifest_file, key)
+            report["duplicated"] = []
+        to_fetch = report["missing"] + report["short"]
+        if not to_fetch or rounds >= max_rounds:
+            break
+        rounds += 1
+        chunks = [to_fetch[i::workers] for i in range(min(workers, len(to_fetch)))]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            errors.extend(error for error in executor.map(fetch_chunk, chunks) if error is not None)
+        refetched += len(to_fetch)
+
+    verdicts = count_crawl_verdicts(verdict_dir, manifest_file, key)
+    report["page_rows"] = report["rows"]
+    report["rows"] = report["rows"] if verdicts is None else verdicts
+    report.update({
+        "complete": report["res_num"] is not None and not report["missing"] and not report["short"] and report["rows"] == report["res_num"],
+        "rounds": rounds,
+        "refetched": refetched,
+        "removed": removed,
+        "errors": errors,
+    })
+    return report
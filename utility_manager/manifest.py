@@ -0,0 +1,135 @@
+# manifest.py
+
+import json
+import threading
+from datetime import datetime
+from os import replace as os_replace
+from pathlib import Path
+
+manifest_lock = threading.Lock() # partitions of a crawl update the same manifest from several threads
+
+def read_manifest(verdict_dir:str, manifest_file:str) -> dict:
+    """
+    Reads the crawl manifest of a year: a JSON dictionary with one entry per query.
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the verdicts index files
+    manifest_file: str,
+        manifest file name (e.g. 2023_manifest.json)
+
+    Returns
+    -----------------------
+    The manifest dictionary, empty if the file does not exist or is not valid JSON.
+    """
+    file_path = Path(verdict_dir) / manifest_file
+    if not file_path.exists():
+        return {}
+    try:
+        with open(file_path, 'r') as fp:
+            data = json.load(fp)
+    except json.JSONDecodeError:
+        print(f"WARNING! Manifest '{file_path}' is not valid JSON, ignoring it")
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def update_manifest_entry(verdict_dir:str, manifest_file:str, query:str, **values) -> dict:
+    """
+    Updates (or creates) the manifest entry of a query, writing the file atomically.
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the verdicts index files
+    manifest_file: str,
+        manifest file name (e.g. 2023_manifest.json)
+    query: str,
+        the search query the entry refers to
+    values:
+        fields to be set in the entry (e.g. res_num, total_pages, complete)
+
+    Returns
+    -----------------------
+    The updated entry.
+    """
+    with manifest_lock:
+        manifest = read_manifest(verdict_dir, manifest_file)
+        entry = manifest.get(query, {})
+        entry.update(values)
+        entry["updated_at"] = datetime.now().replace(microsecond=0).isoformat()
+        manifest[query] = entry
+        write_manifest(verdict_dir, manifest_file, manifest)
+    return entry
+
+
+def write_manifest(verdict_dir:str, manifest_file:str, manifest:dict) -> None:
+    """
+    Writes the crawl manifest of a year atomically (callers hold manifest_lock).
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the verdicts index files
+    manifest_file: str,
+        manifest file name (e.g. 2023_manifest.json)
+    manifest: dict,
+        the whole manifest
+    """
+    file_path = Path(verdict_dir) / manifest_file
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    temp_file_path = str(file_path) + '.temp'
+    with open(temp_file_path, 'w') as fp:
+        json.dump(manifest, fp, indent=4)
+    os_replace(temp_file_path, file_path)
+
+
+def record_manifest_page(verdict_dir:str, manifest_file:str, query:str, page:int, rows:int) -> None:
+    """
+    Records in the manifest entry of a query that a results page has been written to the index:
+    its number of rows (of the last write) and how many times it has been written.
+
+    Parameters
+    -----------------------
+    verdict_dir: str,
+        directory of the verdicts index files
+    manifest_file: str,
+        manifest file name (e.g. 2023_manifest.json)
+    query: str,
+        the manifest key of the crawl (see manifest_key)
+    page: int,
+        the results page
+    rows: int,
+        the verdicts written for the page
+    """
+    with manifest_lock:
+        manifest = read_manifest(verdict_dir, manifest_file)
+        entry = manifest.setdefault(query, {})
+        pages = entry.setdefault("pages", {})
+        page_record = pages.get(str(page), {"rows": 0, "writes": 0})
+        page_record["rows"] = rows
+        page_record["writes"] += 1
+        pages[str(page)] = page_record
+        write_manifest(verdict_dir, manifest_file, manifest)
+
+
+def manifest_key(query:str, filters:dict=None) -> str:
+    """
+    Returns the manifest key of a crawl: the query, followed by the form filters of a partition if any.
+
+    Parameters
+    -----------------------
+    query: str,
+        the search query
+    filters: dict,
+        extra form fields of a partition (optional)
+
+    Returns
+    -----------------------
+    The manifest key, e.g. "appalt* [SedeItem=cds]".
+    """
+    if not filters:
+        return query
+    values = ", ".join(f"{name.rsplit('_', 1)[-1]}={value}" for name, value in sorted(filters.items()))
+    return f"{query} [{values}]"
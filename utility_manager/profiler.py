@@ -0,0 +1,241 @@
+# profiler.py
+# Timing spans (Chrome trace / speedscope), bounded cProfile and stack sampling for the entry points
+
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+PROFILE_MODES = ("trace", "cprofile", "sample")
+
+# profiling state, set by start_profiling
+profile_mode = None # None means that the spans cost a single check
+profile_window = 0.0
+profile_dir = None
+profile_start = 0.0
+profile_stamp = ""
+trace_events = []
+cprofile_obj = None
+sampler_thread = None
+sampler_stop = threading.Event()
+sample_counts = {}
+
+
+@contextmanager
+def span(name:str, **args):
+    """
+    Times a block as a Chrome trace event ('X' phase) when profiling is active; a no-op otherwise.
+
+    Parameters
+    -----------------------
+    name: str,
+        name of the span (e.g. 'submit_selected')
+    args:
+        values shown with the span in the trace viewer (e.g. page=3)
+    """
+    if profile_mode is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        end = time.perf_counter()
+        trace_events.append({
+            "name": name,
+            "ph": "X",
+            "ts": (start - profile_start) * 1e6,
+            "dur": (end - start) * 1e6,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+            "args": args,
+        })
+        if cprofile_obj is not None and end - profile_start > profile_window:
+            stop_cprofile()
+
+
+def stop_cprofile() -> None:
+    """
+    Stops the cProfile window (the profiler runs in the thread that started it, so it is stopped from a span of that thread).
+    """
+    global cprofile_obj
+    if cprofile_obj is None or threading.current_thread() is not threading.main_thread():
+        return
+    cprofile_obj.disable()
+    cprofile_obj.dump_stats(str(output_path("pstats")))
+    cprofile_obj = None
+
+
+def _sampler(interval:float) -> None:
+    """
+    Samples the stacks of all the other threads every interval seconds until the window ends, counting the collapsed stacks.
+    """
+    own_id = threading.get_ident()
+    while not sampler_stop.wait(interval):
+        if time.perf_counter() - profile_start > profile_window:
+            break
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            key = ";".join(reversed(stack))
+            sample_counts[key] = sample_counts.get(key, 0) + 1
+
+
+def output_path(extension:str) -> Path:
+    """
+    Returns the path of a profile output file, named after the profiling start time.
+    """
+    return Path(profile_dir) / f"profile_{profile_stamp}.{extension}"
+
+
+def start_profiling(mode:str, window:float, output_dir:str, interval:float=0.005) -> None:
+    """
+    Starts profiling: the spans are always recorded, plus cProfile or stack sampling for the first window seconds.
+
+    Parameters
+    -----------------------
+    mode: str,
+        'trace' (spans only), 'cprofile' or 'sample'
+    window: float,
+        seconds of cProfile or sampling from the start (the spans cover the whole run)
+    output_dir: str,
+        directory of the profile files
+    interval: float,
+        sampling interval in seconds (mode 'sample')
+    """
+    global profile_mode, profile_window, profile_dir, profile_start, profile_stamp, cprofile_obj, sampler_thread
+    if mode not in PROFILE_MODES:
+        raise ValueError(f"Unknown profile mode '{mode}', expected one of {PROFILE_MODES}")
+    profile_mode = mode
+    profile_window = window
+    profile_dir = output_dir
+    profile_stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    trace_events.clear()
+    sample_counts.clear()
+    profile_start = time.perf_counter()
+    if mode == "cprofile":
+        import cProfile
+        cprofile_obj = cProfile.Profile()
+        cprofile_obj.enable()
+    elif mode == "sample":
+        sampler_stop.clear()
+        sampler_thread = threading.Thread(target=_sampler, args=(interval,), name="profile-sampler", daemon=True)
+        sampler_thread.start()
+
+
+def stop_profiling() -> list:
+    """
+    Stops profiling and writes the profile files: <stamp>.trace.json (Chrome trace, opens in chrome://tracing, Perfetto
+    and speedscope), plus <stamp>.pstats (cProfile) or <stamp>.folded (collapsed stacks for flamegraph.pl and speedscope).
+
+    Returns
+    -----------------------
+    List of the files written.
+    """
+    global profile_mode, sampler_thread
+    if profile_mode is None:
+        return []
+    written = []
+    if cprofile_obj is not None:
+        stop_cprofile()
+    if profile_mode == "cprofile":
+        written.append(output_path("pstats"))
+    if sampler_thread is not None:
+        sampler_stop.set()
+        sampler_thread.join()
+        sampler_thread = None
+        folded_path = output_path("folded")
+        with open(folded_path, 'w') as fp:
+            for stack, count in sorted(sample_counts.items()):
+                fp.write(f"{stack} {count}\n")
+        written.append(folded_path)
+
+    trace_path = output_path("trace.json")
+    with open(trace_path, 'w') as fp:
+        json.dump({"traceEvents": trace_events, "displayTimeUnit": "ms"}, fp)
+    written.insert(0, trace_path)
+    profile_mode = None
+    return written
+
+
+def pop_profile_options(argv:list) -> tuple:
+    """
+    Extracts the '--profile [mode]' and '--profile-window <seconds>' options from a command line.
+
+    Parameters
+    -----------------------
+    argv: list,
+        command line arguments (without the script name)
+
+    Returns
+    -----------------------
+    remaining arguments, profile mode (None if not requested), window in seconds
+
+    Raises
+    -----------------------
+    ValueError if the mode is unknown or the window is not a positive number of seconds.
+    """
+    remaining = []
+    mode = None
+    window = 60.0
+    i = 0
+    while i < len(argv):
+        arg = argv[i]
+        if arg == "--profile":
+            mode = "trace"
+            if i + 1 < len(argv) and argv[i + 1] in PROFILE_MODES:
+                mode = argv[i + 1]
+                i += 1
+        elif arg.startswith("--profile="):
+            mode = arg.split("=", 1)[1]
+            if mode not in PROFILE_MODES:
+                raise ValueError(f"Invalid --profile mode '{mode}', expected one of {', '.join(PROFILE_MODES)}")
+        elif arg == "--profile-window":
+            value = argv[i + 1] if i + 1 < len(argv) else ""
+            try:
+                window = float(value)
+            except ValueError:
+                window = 0.0
+            if not window > 0:
+                raise ValueError(f"Invalid --profile-window '{value}', expected a positive number of seconds")
+            i += 1
+        else:
+            remaining.append(arg)
+        i += 1
+    return remaining, mode, window
+
+
+def summarize_spans(limit:int=10) -> list:
+    """
+    Returns the total time by span name, longest first: list of (name, count, seconds).
+    """
+    totals = {}
+    for event in trace_events:
+        count, duration = totals.get(event["name"], (0, 0.0))
+        totals[event["name"]] = (count + 1, duration + event["dur"] / 1e6)
+    return sorted(((name, count, seconds) for name, (count, seconds) in totals.items()), key=lambda item: -item[2])[:limit]
+
+
+def finish_profiling() -> None:
+    """
+    Stops profiling (if active), writes the profile files and prints where they are with the slowest spans.
+    """
+    if profile_mode is None:
+        return
+    written = stop_profiling()
+    print(">> Profile")
+    for name, count, seconds in summarize_spans():
+        print(f"{name}: {count} spans, {seconds:.3f}s")
+    for path in written:
+        print("Profile file:", path)
+    print()